@@ -1,9 +1,12 @@
 # -*- encoding: utf-8 -*-
+import time
 from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from importlib import import_module
 
+from apps.startup import startup_report
+
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -13,6 +16,19 @@ def register_extensions(app):
     db.init_app(app)
     login_manager.init_app(app)
 
+    from apps.authentication.cache import user_cache
+    user_cache.configure(size=app.config.get('USER_CACHE_SIZE', 1024),
+                         ttl=app.config.get('USER_CACHE_TTL', 60.0))
+
+    from apps.authentication.tokens import api_tokens
+    api_tokens.configure(secret=app.config.get('API_TOKEN_SECRET', app.config['SECRET_KEY']),
+                         cache_ttl=app.config.get('API_TOKEN_CACHE_TTL', 300.0))
+
+    from apps.authentication.util import configure_hashing
+    configure_hashing(iterations=app.config.get('PASSWORD_HASH_ITERATIONS', 100000),
+                      workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+                      max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 2))
+
 
 # def register_blueprints(app):
 #     for module_name in ('authentication', 'home'):
@@ -25,6 +41,8 @@ def configure_database(app):
     @app.before_first_request
     def initialize_database():
         db.create_all()
+        from apps.authentication.models import add_missing_user_columns
+        add_missing_user_columns()
 
     @app.teardown_request
     def shutdown_session(exception=None):
@@ -35,24 +53,81 @@ from apps.authentication.oauth import github_blueprint
 def create_app(config):
     app = Flask(__name__)
     app.config.from_object(config)
-    register_extensions(app)
+    with startup_report.timed('extensions'):
+        register_extensions(app)
 
     app.register_blueprint(github_blueprint, url_prefix="/login")
     
-    register_blueprints(app)
+    with startup_report.timed('blueprints'):
+        register_blueprints(app)
     configure_database(app)
+
+    # El video (cv2 + mediapipe) no se importa aquí: ver apps/video
+    from apps import video
+    video.init_app(app)
     
     # Move Arduino initialization here, after all blueprints are registered
+    # (non-blocking: a background supervisor opens the serial port)
+    arduino_started = time.perf_counter()
     try:
-        from apps.arduino.controller import init_arduino
-        controller = init_arduino(port=app.config.get('ARDUINO_PORT', 'COM12'))
+        from apps.arduino.controller import init_arduino, parse_servo_angles
+        from apps.arduino.ports import port_registry
+        port_registry.configure(ttl=app.config.get('ARDUINO_PORTS_TTL', 5.0),
+                                watch=app.config.get('ARDUINO_PORTS_WATCH', True))
+        controller = init_arduino(
+            port=app.config.get('ARDUINO_PORT', 'COM12'),
+            baud_rate=app.config.get('ARDUINO_BAUD_RATE', 9600),
+            baud_candidates=app.config.get('ARDUINO_BAUD_CANDIDATES'),
+            home_angles=parse_servo_angles(app.config.get('ARDUINO_HOME_ANGLES')),
+            reset_group_size=app.config.get('ARDUINO_RESET_GROUP_SIZE', 0),
+            reset_interval=app.config.get('ARDUINO_RESET_INTERVAL', 0.1),
+            coalesce_window=app.config.get('ARDUINO_COALESCE_WINDOW', 0.02),
+            protocol=app.config.get('ARDUINO_PROTOCOL', 'ascii'),
+            reconnect_min=app.config.get('ARDUINO_RECONNECT_MIN', 0.5),
+            reconnect_max=app.config.get('ARDUINO_RECONNECT_MAX', 30.0)
+        )
         app.logger.info(f"Arduino controller initialized: {controller is not None}")
     except Exception as e:
         app.logger.error(f"Error initializing Arduino controller: {str(e)}")
+    startup_report.record('arduino', time.perf_counter() - arduino_started)
+
+    motion_started = time.perf_counter()
+    try:
+        from apps.arduino.motion import init_motion
+        init_motion(
+            tick_hz=app.config.get('ARDUINO_MOTION_TICK_HZ', 50.0),
+            profile=app.config.get('ARDUINO_MOTION_PROFILE', 'min_jerk'),
+            max_velocity=app.config.get('ARDUINO_MOTION_MAX_VELOCITY', 180.0)
+        )
+    except Exception as e:
+        app.logger.error(f"Error initializing motion planner: {str(e)}")
+    startup_report.record('motion', time.perf_counter() - motion_started)
+
+    teleop_started = time.perf_counter()
+    try:
+        from apps.arduino.teleop import init_teleop, parse_joints
+        init_teleop(
+            joints=parse_joints(app.config.get('TELEOP_JOINTS')),
+            camera_id=app.config.get('TELEOP_CAMERA', 0),
+            rate_hz=app.config.get('TELEOP_RATE_HZ', 30.0),
+            deadband=app.config.get('TELEOP_DEADBAND', 1),
+            filter=app.config.get('TELEOP_FILTER', 'one_euro'),
+            min_cutoff=app.config.get('TELEOP_MIN_CUTOFF', 1.0),
+            beta=app.config.get('TELEOP_BETA', 0.02),
+            alpha=app.config.get('TELEOP_EMA_ALPHA', 0.5),
+            min_visibility=app.config.get('TELEOP_MIN_VISIBILITY', 0.5)
+        )
+    except Exception as e:
+        app.logger.error(f"Error initializing teleoperation: {str(e)}")
+    startup_report.record('teleop', time.perf_counter() - teleop_started)
     
     return app
 
 def register_blueprints(app):
-    for module_name in ('authentication', 'home', 'arduino'):  # Añadir 'arduino'
+    for module_name in ('authentication', 'home', 'arduino', 'video'):  # Añadir 'arduino'
         module = import_module('apps.{}.routes'.format(module_name))
-        app.register_blueprint(module.blueprint)
\ No newline at end of file
+        app.register_blueprint(module.blueprint)
+
+    # API con token para clientes automáticos
+    from apps.arduino.api import api_blueprint
+    app.register_blueprint(api_blueprint)
\ No newline at end of file
@@ -3,8 +3,22 @@
 Servo servos[30];  // Array para 30 servos
 int servo_pins[30] = {2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39};
 
+// Protocolo binario (ver apps/arduino/protocol.py); se activa con "PROTO,BIN"
+const byte SYNC_SINGLE = 0xA5;  // A5 seq indice angulo xor
+const byte SYNC_BATCH = 0xA6;   // A6 seq n (indice angulo)*n xor
+const byte SYNC_FULL = 0xA7;    // A7 seq angulo*30 xor
+const byte SYNC_ACK = 0x5A;     // 5A seq estado xor
+
+const long BASE_BAUD = 9600;  // Velocidad de arranque; el servidor puede pedir otra
+long currentBaud = BASE_BAUD;
+
+bool binaryMode = false;
+byte packet[64];
+int packetLen = 0;
+int expectedLen = 0;
+
 void setup() {
-    Serial.begin(9600);  // Inicializar comunicación serial
+    Serial.begin(BASE_BAUD);  // Inicializar comunicación serial
     delay(2000);  // Esperar 2 segundos para inicializar correctamente
 
     // Asociar los pines con los servos
@@ -16,25 +30,179 @@ void setup() {
     Serial.println("Listo para recibir comandos.");
 }
 
+// Aplica un par "id,angulo"; devuelve true si era válido
+bool applyServo(String pair) {
+    int commaIndex = pair.indexOf(',');  // Buscar la coma que separa los valores
+    if (commaIndex <= 0) {
+        return false;
+    }
+    int servo_id = pair.substring(0, commaIndex).toInt();
+    int angle = pair.substring(commaIndex + 1).toInt();
+
+    if (servo_id >= 2 && servo_id <= 31 && angle >= 0 && angle <= 180) {
+        int servo_index = servo_id - 2;  // Convertir pin a índice en array
+        servos[servo_index].write(angle);
+        return true;
+    }
+    return false;
+}
+
+// Cambia a la velocidad pedida y espera un "PING" en ella; si no llega en
+// 500 ms vuelve a la anterior para no perder el enlace
+void changeBaud(long rate) {
+    Serial.print("BAUD ");
+    Serial.println(rate);
+    Serial.flush();
+    Serial.end();
+    Serial.begin(rate);
+
+    String line = "";
+    unsigned long start = millis();
+    while (millis() - start < 500) {
+        if (Serial.available() > 0) {
+            char c = Serial.read();
+            if (c == '\n') {
+                line.trim();
+                if (line == "PING") {
+                    Serial.println("PONG");
+                    currentBaud = rate;
+                    return;
+                }
+                line = "";
+            } else {
+                line += c;
+            }
+        }
+    }
+    Serial.end();
+    Serial.begin(currentBaud);
+}
+
+byte checksum(byte* data, int len) {
+    byte value = 0;
+    for (int i = 0; i < len; i++) {
+        value ^= data[i];
+    }
+    return value;
+}
+
+void sendAck(byte seq, byte status) {
+    byte ack[4] = {SYNC_ACK, seq, status, 0};
+    ack[3] = checksum(ack, 3);
+    Serial.write(ack, 4);
+}
+
+bool writeIndex(int index, int angle) {
+    if (index < 0 || index >= 30 || angle < 0 || angle > 180) {
+        return false;
+    }
+    servos[index].write(angle);
+    return true;
+}
+
+void processPacket() {
+    byte seq = packet[1];
+    if (checksum(packet, packetLen - 1) != packet[packetLen - 1]) {
+        sendAck(seq, 1);  // Trama corrupta
+        return;
+    }
+
+    bool valid = true;
+    if (packet[0] == SYNC_SINGLE) {
+        valid = writeIndex(packet[2], packet[3]);
+    } else if (packet[0] == SYNC_BATCH) {
+        for (int i = 0; i < packet[2]; i++) {
+            valid = writeIndex(packet[3 + 2 * i], packet[4 + 2 * i]) && valid;
+        }
+    } else {
+        for (int i = 0; i < 30; i++) {
+            valid = writeIndex(i, packet[2 + i]) && valid;
+        }
+    }
+    sendAck(seq, valid ? 0 : 2);
+}
+
+void readBinary() {
+    while (Serial.available() > 0) {
+        byte b = Serial.read();
+        if (packetLen == 0) {
+            // Buscar una cabecera válida; el resto se descarta como ruido
+            if (b == SYNC_SINGLE) {
+                expectedLen = 5;
+            } else if (b == SYNC_FULL) {
+                expectedLen = 33;
+            } else if (b == SYNC_BATCH) {
+                expectedLen = 0;  // Se conoce al leer n
+            } else {
+                continue;
+            }
+        }
+        packet[packetLen++] = b;
+
+        if (packet[0] == SYNC_BATCH && packetLen == 3) {
+            if (b > 30) {
+                packetLen = 0;
+                continue;
+            }
+            expectedLen = 4 + 2 * b;
+        }
+        if (expectedLen > 0 && packetLen == expectedLen) {
+            processPacket();
+            packetLen = 0;
+            expectedLen = 0;
+        }
+    }
+}
+
 void loop() {
+    if (binaryMode) {
+        readBinary();
+        return;
+    }
+
     if (Serial.available() > 0) {
+        // Una línea puede traer un servo "2,90" o varios "2,90;3,45;4,120"
         String command = Serial.readStringUntil('\n');  // Leer comando
         command.trim();
 
-        int commaIndex = command.indexOf(',');  // Buscar la coma que separa los valores
-        if (commaIndex > 0) {
-            int servo_id = command.substring(0, commaIndex).toInt();
-            int angle = command.substring(commaIndex + 1).toInt();
+        if (command.startsWith("BAUD,")) {
+            changeBaud(command.substring(5).toInt());
+            return;
+        }
 
-            if (servo_id >= 2 && servo_id <= 31 && angle >= 0 && angle <= 180) {
-                int servo_index = servo_id - 2;  // Convertir pin a índice en array
-                servos[servo_index].write(angle);
+        if (command == "PROTO,BIN") {
+            Serial.println("PROTO BIN");
+            Serial.flush();
+            binaryMode = true;
+            return;
+        }
+
+        if (command.indexOf(';') < 0) {
+            if (applyServo(command)) {
+                int commaIndex = command.indexOf(',');
                 Serial.print("Servo ");
-                Serial.print(servo_id);
+                Serial.print(command.substring(0, commaIndex));
                 Serial.print(" ajustado a ");
-                Serial.print(angle);
+                Serial.print(command.substring(commaIndex + 1));
                 Serial.println("°");
             }
+            return;
+        }
+
+        // Trama múltiple: se responde una sola línea para toda la trama
+        int applied = 0;
+        int start = 0;
+        while (start < (int)command.length()) {
+            int end = command.indexOf(';', start);
+            if (end < 0) {
+                end = command.length();
+            }
+            if (applyServo(command.substring(start, end))) {
+                applied++;
+            }
+            start = end + 1;
         }
+        Serial.print("Servos ajustados: ");
+        Serial.println(applied);
     }
 }
@@ -6,4 +6,11 @@ blueprint = Blueprint(
     'arduino_blueprint',
     __name__,
     url_prefix='/arduino'
-)
\ No newline at end of file
+)
+
+# API para clientes automáticos: token en vez de sesión, errores en JSON
+api_blueprint = Blueprint(
+    'arduino_api_blueprint',
+    __name__,
+    url_prefix='/api/arduino'
+)
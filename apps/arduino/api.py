@@ -0,0 +1,118 @@
+# -*- encoding: utf-8 -*-
+
+from flask import request, jsonify, g
+from werkzeug.exceptions import HTTPException
+
+from apps.arduino import api_blueprint
+from apps.arduino.controller import get_arduino
+from apps.arduino.motion import get_motion
+from apps.authentication.models import load_token_user
+from apps.authentication.tokens import api_tokens
+
+
+# Sin sesión ni Flask-Login: el token y la versión del usuario en la caché
+@api_blueprint.before_request
+def require_token():
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else request.headers.get('X-API-Token')
+    claims = api_tokens.verify(token)
+    user = load_token_user(*claims) if claims is not None else None
+    if user is None:
+        return jsonify({'status': 'error', 'message': 'Token de API inválido, caducado o revocado'}), 401
+    g.api_user_id = user.id
+
+
+@api_blueprint.errorhandler(HTTPException)
+def http_error(e):
+    # Los manejadores de la app renderizan plantillas; aquí siempre JSON
+    return jsonify({'status': 'error', 'message': e.description}), e.code
+
+
+@api_blueprint.app_errorhandler(404)
+@api_blueprint.app_errorhandler(405)
+def routing_error(e):
+    # Rutas inexistentes o método no permitido no llegan a los manejadores
+    # del blueprint; se responden en JSON solo bajo /api/arduino
+    if request.path.startswith(api_blueprint.url_prefix + '/'):
+        return http_error(e)
+    return e
+
+
+@api_blueprint.errorhandler(Exception)
+def unexpected_error(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+def controller_or_error():
+    arduino_controller = get_arduino()
+    if arduino_controller is None:
+        return None, (jsonify({'status': 'error', 'message': 'Arduino controller not initialized'}), 500)
+    return arduino_controller, None
+
+
+def parse_servos(data):
+    """Acepta {"servos": [{servo_id, angle}, ...]} o la lista directamente"""
+    items = data.get('servos', []) if isinstance(data, dict) else data
+    return [(int(item['servo_id']), int(item['angle'])) for item in items]
+
+
+@api_blueprint.route('/status')
+def status():
+    arduino_controller, error = controller_or_error()
+    if error:
+        return error
+    return jsonify(arduino_controller.get_status())
+
+
+@api_blueprint.route('/servos', methods=['GET'])
+def servos():
+    arduino_controller, error = controller_or_error()
+    if error:
+        return error
+    return jsonify({'status': 'success', 'servos': arduino_controller.get_servo_state()})
+
+
+@api_blueprint.route('/servos', methods=['POST'])
+def set_servos():
+    arduino_controller, error = controller_or_error()
+    if error:
+        return error
+    data = request.get_json(silent=True)
+    try:
+        positions = parse_servos(data)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return jsonify({'status': 'error',
+                        'message': 'Datos inválidos, envía una lista de {servo_id, angle} numéricos'}), 400
+    wait = bool(data.get('wait', False)) if isinstance(data, dict) else False
+
+    success, message = arduino_controller.set_servos(positions, wait=wait, timeout=2.0)
+    return jsonify({'status': 'success' if success else 'error', 'message': message}), 200 if success else 400
+
+
+@api_blueprint.route('/move', methods=['POST'])
+def move():
+    data = request.get_json(silent=True)
+    options = data if isinstance(data, dict) else {}
+    try:
+        items = options.get('servos', []) if isinstance(data, dict) else data
+        targets = [dict(item, servo_id=int(item['servo_id']), angle=float(item['angle'])) for item in items]
+        duration = float(options['duration']) if options.get('duration') is not None else None
+        max_velocity = float(options['max_velocity']) if options.get('max_velocity') is not None else None
+    except (ValueError, KeyError, TypeError):
+        return jsonify({'status': 'error',
+                        'message': 'Datos inválidos, envía una lista de {servo_id, angle} numéricos'}), 400
+
+    success, message, plan = get_motion().move(targets, duration=duration, max_velocity=max_velocity,
+                                               profile=options.get('profile'))
+    if not success:
+        return jsonify({'status': 'error', 'message': message}), 400
+    return jsonify({'status': 'success', 'message': message, 'durations': plan})
+
+
+@api_blueprint.route('/reset', methods=['POST'])
+def reset():
+    arduino_controller, error = controller_or_error()
+    if error:
+        return error
+    success, message = arduino_controller.reset_servos()
+    return jsonify({'status': 'success' if success else 'error', 'message': message}), 200 if success else 500
@@ -2,207 +2,969 @@
 
 import serial
 import time
+import queue
 import threading
 import logging
-import serial.tools.list_ports  # Add this for port enumeration
+from array import array
+from collections import deque
+from concurrent.futures import Future
+from apps.arduino.events import EventHub
+from apps.arduino.ports import port_registry
+from apps.arduino.protocol import AsciiProtocol, BinaryProtocol
 
 logger = logging.getLogger(__name__)
 
+
+class SerialCommand:
+    """Comando pendiente de escribir (y confirmar) en el puerto serie"""
+
+    def __init__(self, targets, description):
+        self.targets = targets  # {servo_id: ángulo}; se codifica al escribir
+        self.description = description
+        self.seq = None
+        self.future = Future()
+        self.waiters = []  # Futures de peticiones coalescidas en este comando
+        self.enqueued_at = time.monotonic()
+        self.sent_at = None
+
+    def resolve(self, success, message):
+        for future in [self.future] + self.waiters:
+            if not future.done():
+                future.set_result((success, message))
+
+
+def _resolved(success, message):
+    """Future ya resuelto, para errores detectados antes de encolar"""
+    future = Future()
+    future.set_result((success, message))
+    return future
+
+
+def parse_servo_angles(text):
+    """Convierte "2:90,3:45" en {2: 90, 3: 45}"""
+    angles = {}
+    for item in (text or '').split(','):
+        if ':' not in item:
+            continue
+        servo_id, angle = item.split(':', 1)
+        angles[int(servo_id)] = int(angle)
+    return angles
+
+
 class ArduinoController:
-    def __init__(self, port=None, baud_rate=9600):
+    def __init__(self, port=None, baud_rate=9600, queue_size=256,
+                 max_inflight=4, ack_timeout=0.5, poll_interval=0.005,
+                 home_angles=None, reset_group_size=0, reset_interval=0.1,
+                 coalesce_window=0.02, protocol='ascii', baud_candidates=None,
+                 reconnect_min=0.5, reconnect_max=30.0):
         self.port = port
-        self.baud_rate = baud_rate
+        self.baud_rate = baud_rate  # Velocidad con la que arranca el firmware
+        # Velocidades más altas a probar tras conectar; se queda la más rápida aceptada
+        self.baud_candidates = sorted(baud_candidates or [], reverse=True)
+        self.link_baud_rate = None
         self.arduino = None
         self.connected = False
         self.lock = threading.Lock()  # Para asegurar operaciones thread-safe
+        self._connect_lock = threading.Lock()  # Serializa connect() sin bloquear al escritor
         # Lista de pines de los servos (en un Arduino Mega)
         self.servo_pins = [i for i in range(2, 32)]  # Servos en pines 2-31
-        
+        # Posición de reset por servo; los que no aparezcan vuelven a 90°
+        self.home_angles = dict(home_angles or {})
+        self.reset_group_size = reset_group_size
+        self.reset_interval = reset_interval
+
+        # Estado por servo en arrays compactos (índice = posición en servo_pins):
+        # ángulo pedido, último escrito y último confirmado; -1 = desconocido
+        self._servo_index = {servo_id: index for index, servo_id in enumerate(self.servo_pins)}
+        self._target = array('h', [-1] * len(self.servo_pins))
+        self._last_sent = array('h', [-1] * len(self.servo_pins))
+        self._last_acked = array('h', [-1] * len(self.servo_pins))
+        self._state_lock = threading.Lock()
+        # Cambios de estado y de objetivos empujados a los navegadores (SSE)
+        self.events = EventHub()
+
+        # Cola de comandos drenada por un único hilo dueño del puerto serie
+        self.max_inflight = max_inflight  # El buffer RX del Arduino es de 64 bytes
+        self.ack_timeout = ack_timeout
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._inflight = deque()  # Comandos escritos esperando respuesta (FIFO)
+        # Instantes en que vencieron tramas ASCII cuya línea aún puede llegar tarde
+        self._expired = deque()
+        # Protocolo preferido ('ascii' o 'binary'); el activo se negocia en connect()
+        self.protocol_preference = protocol
+        self.protocol = AsciiProtocol()
+        self._seq = 0
+        self._connected_at = None
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # El supervisor es el único que abre el puerto; reintenta con backoff
+        # exponencial y solo se le despierta antes con _wake desde /connect o
+        # por un error del hilo escritor
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.connecting = False
+        self._supervisor = None
+        self._wake = threading.Event()
+        self._force_reconnect = False
+
+        # Coalescencia "gana la última escritura": como mucho un objetivo
+        # pendiente por servo, {servo_id: [ángulo, visto_por_primera_vez, futures]}
+        self.coalesce_window = coalesce_window
+        self._coalesced = {}
+        self._coalesce_lock = threading.Lock()
+        # Registrar el objetivo y encolarlo es un único paso: si no, dos
+        # peticiones podrían escribirse en el orden contrario al de _target
+        self._claim_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'enqueued': 0,
+            'sent': 0,
+            'acked': 0,
+            'ack_timeouts': 0,
+            'late_replies': 0,
+            'rejected': 0,
+            'coalesced': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'frames_lost': 0,
+            'frames_rejected': 0,
+            'bytes_tx': 0,
+            'bytes_rx': 0,
+            'max_queue_depth': 0,
+            'latency_last_ms': 0.0,
+            'latency_avg_ms': 0.0,
+            'latency_max_ms': 0.0,
+        }
+
+        # Estado publicado para las rutas: se reemplaza entero en cada cambio
+        # (copy-on-write), así leerlo no toma locks ni toca el puerto serie
+        self._status_lock = threading.Lock()
+        self._status = {
+            'connected': False,
+            'connecting': False,
+            'port': port,
+            'baud_rate': baud_rate,
+            'link_baud_rate': None,
+            'protocol': self.protocol.name,
+            'connected_since': None,
+            'last_ack': None,
+            'last_error': None,
+            'connect_attempts': 0,
+            'connect_failures': 0,
+            'errors': 0,
+            'ack_timeouts': 0,
+            'frames_lost': 0,
+            'frames_rejected': 0,
+            'updated_at': time.time(),
+        }
+
         # Don't try to connect at init time, just setup
         logger.info(f"ArduinoController initialized with port={port}, baud_rate={baud_rate}")
 
-    def get_available_ports(self):
-        """Returns a list of available serial ports"""
-        ports = []
-        for port in serial.tools.list_ports.comports():
-            ports.append({
-                'device': port.device,
-                'description': port.description,
-                'hwid': port.hwid
-            })
-        return ports
+    def _publish(self, **changes):
+        """Actualiza la instantánea de estado que sirven las rutas"""
+        with self._status_lock:
+            status = dict(self._status)
+            status.update(changes)
+            status['updated_at'] = time.time()
+            self._status = status
+        self.events.publish('status', status)
+
+    def get_status(self):
+        """Instantánea del estado de la conexión (no modificar el dict devuelto)"""
+        return self._status
+
+    def _count_error(self, name, message=None):
+        """Incrementa un contador de errores y lo refleja en el estado publicado"""
+        with self._metrics_lock:
+            self._metrics[name] += 1
+            value = self._metrics[name]
+        if message is None:
+            self._publish(**{name: value})
+        else:
+            self._publish(**{name: value, 'last_error': message})
+
+    def get_available_ports(self, refresh=False):
+        """Returns a list of available serial ports (cached, see PortRegistry)"""
+        return port_registry.list(refresh=refresh)
 
     def connect(self, retries=3, delay=0.5):
         """Intenta conectar con Arduino con reintentos"""
         if not self.port:
             logger.error("No se especificó ningún puerto")
             return False
-            
+
         logger.info(f"Intentando conectar a Arduino en {self.port} (baud_rate={self.baud_rate})")
-        
+
         # List available ports to help debugging
         available_ports = self.get_available_ports()
         if available_ports:
             logger.info(f"Puertos disponibles: {available_ports}")
         else:
             logger.warning("No se encontraron puertos seriales disponibles")
-            
-        for attempt in range(retries):
-            try:
+
+        # Un solo connect() a la vez (supervisor o /connect). Abrir, esperar el
+        # reset y negociar se hace sin self.lock: el hilo escritor no toca el
+        # puerto mientras connected sea False y las peticiones no esperan
+        with self._connect_lock:
+            for attempt in range(retries):
                 logger.info(f"Intento de conexión {attempt+1}/{retries}")
-                
+
                 # Make sure port is closed before trying
                 with self.lock:
-                    if self.arduino:
-                        try:
-                            self.arduino.close()
-                        except:
-                            pass
-                        self.arduino = None
-                
-                # Open new connection
-                with self.lock:
-                    self.arduino = serial.Serial(self.port, self.baud_rate, timeout=2)
-                    # Add a delay to give Arduino time to reset after connection
-                    time.sleep(2)  # Esperar que Arduino inicie
-                
-                # Try a simple command to test connection
-                test_result = self._test_connection()
-                if test_result:
-                    self.connected = True
+                    self.connected = False
+                    self._publish(connected=False, connected_since=None)
+                    self._fail_inflight("Conexión reiniciada")
+                    previous, self.arduino = self.arduino, None
+                if previous:
+                    try:
+                        previous.close()
+                    except:
+                        pass
+
+                try:
+                    link = serial.Serial(self.port, self.baud_rate, timeout=2)
+                except serial.SerialException as e:
+                    self._publish(last_error=str(e))
+                    logger.error(f"⚠️ Error de conexión en intento {attempt+1}: {str(e)}")
+                    print(f"⚠️ Error de conexión en intento {attempt+1}: {str(e)}")
+                    time.sleep(delay)  # Wait before retry
+                    continue
+
+                try:
+                    ready = self._prepare_link(link)
+                except Exception as e:
+                    logger.error(f"Error preparando la conexión: {str(e)}")
+                    self._publish(last_error=str(e))
+                    ready = False
+
+                if ready:
+                    with self.lock:
+                        self.arduino = link
+                        self._connected_at = time.monotonic()
+                        with self._metrics_lock:
+                            self._metrics['bytes_tx'] = 0
+                            self._metrics['bytes_rx'] = 0
+                        self.connected = True
+                    self._publish(connected=True, port=self.port, baud_rate=self.baud_rate,
+                                  link_baud_rate=self.link_baud_rate,
+                                  protocol=self.protocol.name,
+                                  connected_since=time.time(), last_error=None)
+                    self._ensure_worker()
                     logger.info(f"✅ Conectado a Arduino en {self.port}")
                     return True
-                else:
-                    logger.warning("La conexión no respondió a la prueba")
-                    
-            except serial.SerialException as e:
-                self.arduino = None
-                self.connected = False
-                logger.error(f"⚠️ Error de conexión en intento {attempt+1}: {str(e)}")
-                print(f"⚠️ Error de conexión en intento {attempt+1}: {str(e)}")
-                time.sleep(delay)  # Wait before retry
-                
+
+                logger.warning("La conexión no respondió a la prueba")
+                try:
+                    link.close()
+                except:
+                    pass
+
         logger.error(f"⚠️ No se pudo conectar con Arduino después de {retries} intentos")
         return False
 
-    def _test_connection(self):
+    def _prepare_link(self, link):
+        """Espera el reset del Arduino, prueba el enlace y negocia velocidad y
+        protocolo sobre un puerto recién abierto que aún no ve el hilo escritor"""
+        self.link_baud_rate = self.baud_rate
+        # Tras abrir el puerto el Arduino se reinicia y vuelve a ASCII
+        self.protocol = AsciiProtocol()
+        time.sleep(2)  # Esperar que Arduino inicie
+        if not self._test_connection(link):
+            return False
+        # El Arduino se reinició al abrir el puerto: posiciones desconocidas
+        self._forget_servo_state()
+        self._negotiate_baud_rate(link)
+        self._negotiate_protocol(link)
+        return True
+
+    def _test_connection(self, link):
         """Send a simple command to test if Arduino is responding"""
         try:
             # Send a neutral command (move servo 2 to its current position)
-            with self.lock:
-                if not self.arduino or not self.arduino.is_open:
-                    return False
-                
-                # Flush buffers
-                self.arduino.reset_input_buffer()
-                self.arduino.reset_output_buffer()
-                
-                # Send test command
-                test_cmd = "2,90\n"
-                self.arduino.write(test_cmd.encode())
-                
-                # Wait for response with timeout
-                start_time = time.time()
-                while (time.time() - start_time) < 1.0:  # 1 second timeout
-                    if self.arduino.in_waiting > 0:
-                        response = self.arduino.readline().decode().strip()
-                        logger.info(f"Arduino respondió: {response}")
-                        return True
-                    time.sleep(0.1)
-                    
-                logger.warning("Arduino no respondió a la prueba en el tiempo esperado")
+            if not link.is_open:
                 return False
-                
+
+            # Flush buffers
+            link.reset_input_buffer()
+            link.reset_output_buffer()
+
+            # Send test command
+            test_cmd = "2,90\n"
+            link.write(test_cmd.encode())
+
+            # Wait for response with timeout
+            start_time = time.time()
+            while (time.time() - start_time) < 1.0:  # 1 second timeout
+                if link.in_waiting > 0:
+                    response = link.readline().decode().strip()
+                    logger.info(f"Arduino respondió: {response}")
+                    return True
+                time.sleep(0.1)
+
+            logger.warning("Arduino no respondió a la prueba en el tiempo esperado")
+            return False
+
         except Exception as e:
             logger.error(f"Error durante prueba de conexión: {str(e)}")
             return False
 
+    def _negotiate_baud_rate(self, link):
+        """Sube la velocidad del enlace a la más alta que acepte el firmware
+
+        Por cada candidata se pide "BAUD,<vel>"; el Arduino responde "BAUD <vel>",
+        cambia de velocidad y espera un "PING" a la nueva. Si no llega el "PONG"
+        ambos lados vuelven a la velocidad anterior y se prueba la siguiente.
+        """
+        for rate in self.baud_candidates:
+            if rate <= self.link_baud_rate:
+                break
+            try:
+                link.reset_input_buffer()
+                link.write(f"BAUD,{rate}\n".encode())
+                if self._read_line(link, 0.5, f"BAUD {rate}") is None:
+                    # Firmware sin soporte de cambio de velocidad
+                    logger.info(f"El firmware no negocia velocidad, se mantiene {self.link_baud_rate}")
+                    return
+                link.baudrate = rate
+                time.sleep(0.05)
+                link.reset_input_buffer()
+                link.write(b"PING\n")
+                if self._read_line(link, 0.3, "PONG"):
+                    self.link_baud_rate = rate
+                    logger.info(f"Enlace serie a {rate} baudios")
+                    return
+                logger.warning(f"Sin respuesta a {rate} baudios, se vuelve a {self.link_baud_rate}")
+                link.baudrate = self.link_baud_rate
+                time.sleep(0.6)  # El firmware revierte a los 500 ms sin PING
+            except Exception as e:
+                logger.error(f"Error negociando {rate} baudios: {str(e)}")
+                link.baudrate = self.link_baud_rate
+
+    def _read_line(self, link, timeout, expected):
+        """Espera la línea expected durante la negociación
+
+        Las demás líneas (el banner de arranque, respuestas tardías a la prueba
+        "2,90") se descartan. Devuelve expected, o None si no llegó a tiempo.
+        """
+        start_time = time.time()
+        buffer = bytearray()
+        while (time.time() - start_time) < timeout:
+            waiting = link.in_waiting
+            if waiting:
+                buffer += link.read(waiting)
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    line = line.decode(errors='replace').strip()
+                    if line == expected:
+                        return line
+                    logger.debug(f"Negociación: se ignora {line!r}")
+            else:
+                time.sleep(0.01)
+        return None
+
+    def _negotiate_protocol(self, link):
+        """Pide al Arduino el protocolo binario si está configurado; si el
+        firmware no lo entiende se sigue en ASCII"""
+        if self.protocol_preference != 'binary':
+            return
+        try:
+            link.reset_input_buffer()
+            link.write(b"PROTO,BIN\n")
+            if self._read_line(link, 1.0, "PROTO BIN"):
+                self.protocol = BinaryProtocol(self.servo_pins)
+                logger.info("Protocolo binario activado")
+                return
+        except Exception as e:
+            logger.error(f"Error negociando protocolo: {str(e)}")
+        logger.warning("El firmware no aceptó el protocolo binario, se usa ASCII")
+
     def disconnect(self):
         """Cierra la conexión con Arduino"""
         with self.lock:
+            self.connected = False
+            self._publish(connected=False, connected_since=None)
+            self._fail_inflight("Desconectado")
             if self.arduino and self.arduino.is_open:
                 self.arduino.close()
-                self.connected = False
                 logger.info("Desconectado de Arduino")
 
     def is_connected(self):
-        """Verifica si la conexión está activa"""
-        with self.lock:
-            connected = self.connected and self.arduino and self.arduino.is_open
-        return connected
+        """Verifica si la conexión está activa (sin locks: nunca espera a connect())"""
+        link = self.arduino
+        return bool(self.connected and link is not None and link.is_open)
 
-    def set_servo(self, servo_id, angle):
-        """Mueve un servo a una posición específica"""
-        # Validar que los valores sean correctos
+    def _validate(self, servo_id, angle):
+        """Devuelve un mensaje de error si el comando no es válido, o None"""
         if not (0 <= angle <= 180):
-            return False, "Ángulo fuera de rango (0-180)"
+            return "Ángulo fuera de rango (0-180)"
         if servo_id not in self.servo_pins:
-            return False, f"ID de servo inválido, debe estar entre {min(self.servo_pins)} y {max(self.servo_pins)}"
+            return f"ID de servo inválido, debe estar entre {min(self.servo_pins)} y {max(self.servo_pins)}"
+        return None
+
+    def queue_servo(self, servo_id, angle):
+        """Encola el movimiento de un servo y devuelve un Future con (éxito, mensaje)
+
+        Con coalesce_window > 0 solo se guarda el último ángulo pedido para
+        cada servo durante la ventana; los intermedios se descartan y todos
+        los servos vencidos salen juntos en una trama.
+        """
+        if self.coalesce_window <= 0:
+            return self.queue_servos([(servo_id, angle)])
+
+        error = self._validate(servo_id, angle)
+        if error:
+            return _resolved(False, error)
+        if not self._ensure_connected():
+            return _resolved(False, "Arduino no conectado")
+        future = Future()
+        with self._claim_lock:
+            if not self._claim_targets({servo_id: angle}):
+                return _resolved(True, f"Servo {servo_id} ya en {angle}° (sin cambios)")
+            with self._coalesce_lock:
+                entry = self._coalesced.get(servo_id)
+                if entry is None:
+                    self._coalesced[servo_id] = [angle, time.monotonic(), [future]]
+                else:
+                    entry[0] = angle
+                    entry[2].append(future)
+        if entry is not None:
+            with self._metrics_lock:
+                self._metrics['coalesced'] += 1
+        self._ensure_worker()
+        return future
+
+    def queue_servos(self, positions, force=False):
+        """Encola varios servos como una sola trama "id,ángulo;id,ángulo\n"
+
+        Se validan todos antes de enviar nada; si un servo aparece repetido
+        gana la última posición. Los servos cuyo objetivo ya es ese ángulo no
+        se vuelven a enviar salvo con force=True.
+        """
+        targets = {}
+        for servo_id, angle in positions:
+            error = self._validate(servo_id, angle)
+            if error:
+                return _resolved(False, f"Servo {servo_id}: {error}")
+            targets.pop(servo_id, None)
+            targets[servo_id] = angle
+        if not targets:
+            return _resolved(False, "No se indicó ningún servo")
+
+        if not self._ensure_connected():
+            return _resolved(False, "Arduino no conectado")
+        with self._claim_lock:
+            changed = self._claim_targets(targets, force)
+            if not changed:
+                if len(targets) == 1:
+                    servo_id, angle = next(iter(targets.items()))
+                    return _resolved(True, f"Servo {servo_id} ya en {angle}° (sin cambios)")
+                return _resolved(True, f"{len(targets)} servos sin cambios")
+            targets = {servo_id: targets[servo_id] for servo_id in changed}
+
+            # Un objetivo coalescido anterior no debe pisar después a esta trama
+            superseded = []
+            with self._coalesce_lock:
+                for servo_id in targets:
+                    entry = self._coalesced.pop(servo_id, None)
+                    if entry is not None:
+                        superseded.extend(entry[2])
+
+            future = self._submit(self._frame(targets))
+        for waiter in superseded:
+            future.add_done_callback(lambda done, waiter=waiter: waiter.set_result(done.result()))
+        return future
+
+    def _claim_targets(self, targets, force=False):
+        """Registra los nuevos objetivos y devuelve los servos que cambian"""
+        changed = []
+        with self._state_lock:
+            for servo_id, angle in targets.items():
+                index = self._servo_index[servo_id]
+                if force or self._target[index] != angle:
+                    self._target[index] = angle
+                    changed.append(servo_id)
+        if changed:
+            self.events.publish('servos', {servo_id: targets[servo_id] for servo_id in changed}, merge=True)
+        skipped = len(targets) - len(changed)
+        if skipped:
+            with self._metrics_lock:
+                self._metrics['unchanged'] += skipped
+        return changed
+
+    def _release_targets(self, targets):
+        """Una trama que falló deja esos objetivos sin confirmar: se reenviarán"""
+        released = {}
+        with self._state_lock:
+            for servo_id, angle in targets.items():
+                index = self._servo_index[servo_id]
+                if self._target[index] == angle:
+                    self._target[index] = -1
+                    released[servo_id] = None
+        if released:
+            self.events.publish('servos', released, merge=True)
+
+    def _forget_servo_state(self):
+        with self._state_lock:
+            for values in (self._target, self._last_sent, self._last_acked):
+                values[:] = array('h', [-1] * len(values))
+        self.events.publish('servos', {servo_id: None for servo_id in self.servo_pins}, merge=True)
+
+    def get_servo_state(self):
+        """[{servo_id, target, last_sent, last_acked}] con None si se desconoce"""
+        with self._state_lock:
+            rows = list(zip(self.servo_pins, self._target, self._last_sent, self._last_acked))
+        return [{
+            'servo_id': servo_id,
+            'target': target if target >= 0 else None,
+            'last_sent': sent if sent >= 0 else None,
+            'last_acked': acked if acked >= 0 else None,
+        } for servo_id, target, sent, acked in rows]
+
+    def get_servo_targets(self):
+        """{servo_id: ángulo pedido o None}, el mismo formato que los eventos 'servos'"""
+        with self._state_lock:
+            targets = list(self._target)
+        return {servo_id: angle if angle >= 0 else None
+                for servo_id, angle in zip(self.servo_pins, targets)}
+
+    def subscribe_events(self):
+        """Canal con los eventos 'status' y 'servos'; liberar con unsubscribe_events()"""
+        return self.events.subscribe()
+
+    def unsubscribe_events(self, channel):
+        self.events.unsubscribe(channel)
+
+    def get_servo_angle(self, servo_id):
+        """Último ángulo pedido para un servo, o None si se desconoce"""
+        angle = self._target[self._servo_index[servo_id]]
+        return angle if angle >= 0 else None
+
+    def _ensure_connected(self):
+        """Nunca conecta en el hilo que llama ni adelanta los reintentos del
+        supervisor: sin enlace el comando se rechaza y ya"""
+        return self.is_connected()
+
+    def _frame(self, targets, enqueued_at=None):
+        """Construye el comando serie para {servo_id: ángulo}"""
+        if len(targets) == 1:
+            servo_id, angle = next(iter(targets.items()))
+            description = f"Servo {servo_id} movido a posición {angle}"
+        else:
+            description = f"{len(targets)} servos movidos"
+        frame = SerialCommand(targets, description)
+        if enqueued_at is not None:
+            frame.enqueued_at = enqueued_at
+        frame.future.add_done_callback(
+            lambda done: None if done.result()[0] else self._release_targets(targets))
+        return frame
+
+    def _take_coalesced(self):
+        """Saca los objetivos cuya ventana venció, como una única trama"""
+        if not self._coalesced:
+            return None
+        now = time.monotonic()
+        with self._coalesce_lock:
+            due = [servo_id for servo_id, entry in self._coalesced.items()
+                   if now - entry[1] >= self.coalesce_window]
+            entries = [(servo_id, self._coalesced.pop(servo_id)) for servo_id in due]
+        if not entries:
+            return None
+
+        frame = self._frame({servo_id: entry[0] for servo_id, entry in entries},
+                            enqueued_at=min(entry[1] for _, entry in entries))
+        for _, entry in entries:
+            frame.waiters.extend(entry[2])
+        return frame
+
+    def set_servo(self, servo_id, angle, wait=False, timeout=None):
+        """Mueve un servo a una posición específica
+
+        Por defecto solo encola el comando y vuelve inmediatamente; con
+        wait=True espera a que el Arduino confirme (o venza el timeout).
+        """
+        future = self.queue_servo(servo_id, angle)
+        if wait or future.done():
+            return self._wait(future, timeout)
+        return True, f"Servo {servo_id} → {angle} encolado"
+
+    def set_servos(self, positions, wait=False, timeout=None):
+        """Mueve varios servos con una única escritura (un viaje de ida y vuelta)"""
+        positions = list(positions)
+        future = self.queue_servos(positions)
+        if wait or future.done():
+            return self._wait(future, timeout)
+        return True, f"{len(positions)} servos encolados"
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+
+    def _submit(self, command):
+        """Pone un comando en la cola del hilo escritor"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(command)
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics['rejected'] += 1
+            command.resolve(False, "Cola de comandos llena, inténtalo de nuevo")
+            return command.future
+
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self._metrics['enqueued'] += 1
+            if depth > self._metrics['max_queue_depth']:
+                self._metrics['max_queue_depth'] = depth
+        return command.future
+
+    def _ensure_worker(self):
+        """Arranca el hilo escritor si todavía no está corriendo"""
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self._serial_loop,
+                                                name='arduino-serial',
+                                                daemon=True)
+                self._worker.start()
+
+    def start(self):
+        """Arranca en segundo plano el supervisor de conexión y el hilo escritor"""
+        self._ensure_worker()
+        with self._worker_lock:
+            if self._supervisor is None or not self._supervisor.is_alive():
+                self._supervisor = threading.Thread(target=self._supervise,
+                                                    name='arduino-supervisor',
+                                                    daemon=True)
+                self._supervisor.start()
+
+    def request_connect(self, port=None, baud_rate=None):
+        """Pide al supervisor (re)conectar, opcionalmente con otro puerto o velocidad"""
+        if port is not None and port != self.port:
+            self.port = port
+            self._force_reconnect = True
+        if baud_rate is not None and baud_rate != self.baud_rate:
+            self.baud_rate = baud_rate
+            self._force_reconnect = True
+        self.start()
+        self._wake.set()
+
+    def _supervise(self):
+        """Mantiene la conexión abierta; espera min→max segundos entre intentos"""
+        backoff = self.reconnect_min
+        while not self._stop.is_set():
+            if self._force_reconnect:
+                self._force_reconnect = False
+                self.disconnect()
+                backoff = self.reconnect_min
+
+            if self.port and not self.is_connected():
+                self.connecting = True
+                self._publish(connecting=True, port=self.port,
+                              connect_attempts=self._status['connect_attempts'] + 1)
+                try:
+                    connected = self.connect(retries=1)
+                except Exception as e:
+                    logger.error(f"Error inesperado conectando: {str(e)}")
+                    self._publish(last_error=str(e))
+                    connected = False
+                finally:
+                    self.connecting = False
+                    self._publish(connecting=False)
+
+                if not connected:
+                    self._publish(connect_failures=self._status['connect_failures'] + 1)
+                    logger.info(f"Reintento de conexión en {backoff:.1f}s")
+                    self._wake.wait(backoff)
+                    self._wake.clear()
+                    backoff = min(backoff * 2, self.reconnect_max)
+                    continue
+                backoff = self.reconnect_min
+
+            self._wake.wait(1.0)
+            self._wake.clear()
+
+    def stop(self):
+        """Detiene el supervisor y el hilo escritor (los comandos encolados se descartan)"""
+        self._stop.set()
+        self._wake.set()
+        for thread in (self._worker, self._supervisor):
+            if thread is not None:
+                thread.join(timeout=1.0)
+
+    def _serial_loop(self):
+        """Único dueño del puerto: escribe en cadena y empareja respuestas"""
+        while not self._stop.is_set():
+            command = None
+            if len(self._inflight) < self.max_inflight:
+                try:
+                    command = self._queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    pass
+            else:
+                time.sleep(self.poll_interval)
+
+            with self.lock:
+                if command is not None:
+                    self._write_command(command)
+                    # Pipeline: escribir seguidos los comandos que ya esperan
+                    while len(self._inflight) < self.max_inflight:
+                        try:
+                            command = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        self._write_command(command)
+                if len(self._inflight) < self.max_inflight:
+                    frame = self._take_coalesced()
+                    if frame is not None:
+                        self._write_command(frame)
+                self._read_replies()
+                self._expire_inflight()
+
+    def _write_command(self, command):
+        """Escribe un comando; debe llamarse con self.lock tomado"""
+        if not (self.connected and self.arduino and self.arduino.is_open):
+            command.resolve(False, "Arduino no conectado")
+            return
+
+        try:
+            self._seq = (self._seq + 1) & 0xFF
+            command.seq = self._seq
+            payload = self.protocol.encode(command.targets, command.seq)
+            logger.debug(f"Enviando comando: {payload!r}")
+            self.arduino.write(payload)
+            command.sent_at = time.monotonic()
+            with self._state_lock:
+                for servo_id, angle in command.targets.items():
+                    self._last_sent[self._servo_index[servo_id]] = angle
+            self._inflight.append(command)
+            with self._metrics_lock:
+                self._metrics['sent'] += 1
+                self._metrics['bytes_tx'] += len(payload)
+        except Exception as e:
+            logger.error(f"Error enviando comando: {str(e)}")
+            self.connected = False
+            self._wake.set()
+            self._publish(connected=False, connected_since=None)
+            self._count_error('errors', str(e))
+            command.resolve(False, f"Error: {str(e)}")
+            self._fail_inflight(f"Error: {str(e)}")
+
+    def _read_replies(self):
+        """Lee lo disponible sin bloquear y resuelve los comandos confirmados"""
+        if not (self.connected and self.arduino and self.arduino.is_open):
+            return
+        try:
+            waiting = self.arduino.in_waiting
+            if not waiting:
+                return
+            data = self.arduino.read(waiting)
+            with self._metrics_lock:
+                self._metrics['bytes_rx'] += len(data)
+            replies = self.protocol.feed(data)
+        except Exception as e:
+            logger.error(f"Error leyendo de Arduino: {str(e)}")
+            self.connected = False
+            self._wake.set()
+            self._publish(connected=False, connected_since=None)
+            self._count_error('errors', str(e))
+            self._fail_inflight(f"Error: {str(e)}")
+            return
+
+        for seq, ok, response in replies:
+            logger.debug(f"Respuesta Arduino: {response}")
+            self._handle_reply(seq, ok, response)
+
+    def _handle_reply(self, seq, ok, response):
+        # ASCII: sin número de secuencia, una línea por trama en orden
+        if seq is None:
+            # El texto de la respuesta identifica la trama; si no coincide con la
+            # primera pendiente puede ser la línea tardía de una ya vencida
+            if self._inflight and response == self.protocol.expected_reply(self._inflight[0].targets):
+                self._complete(self._inflight.popleft(), acked=True)
+            elif self._is_late_reply():
+                with self._metrics_lock:
+                    self._metrics['late_replies'] += 1
+            elif self._inflight:
+                # Firmware con otro texto: emparejar por orden
+                self._complete(self._inflight.popleft(), acked=True)
+            return
+
+        if not any(command.seq == seq for command in self._inflight):
+            return  # ACK de una trama que ya se dio por vencida
+
+        # Las tramas anteriores sin ACK se perdieron o llegaron corruptas
+        while self._inflight[0].seq != seq:
+            self._count_error('frames_lost')
+            self._inflight.popleft().resolve(False, "Trama perdida (sin ACK del Arduino)")
+
+        command = self._inflight.popleft()
+        if ok:
+            self._complete(command, acked=True)
+        else:
+            self._count_error('frames_rejected', response)
+            command.resolve(False, f"Trama rechazada por Arduino: {response}")
+
+    def _expire_inflight(self):
+        """Da por buenos los comandos cuya respuesta no llegó a tiempo"""
+        now = time.monotonic()
+        while self._inflight and now - self._inflight[0].sent_at > self.ack_timeout:
+            if self.protocol.name == 'ascii':
+                # Si su línea llega después, se descarta en vez de emparejarla por orden
+                self._expired.append(now)
+            self._complete(self._inflight.popleft(), acked=False)
+
+    def _is_late_reply(self):
+        """True si la línea recibida puede ser de una trama ASCII ya vencida
+
+        Las que vencieron hace más de 4 ack_timeout se dan por perdidas: una
+        línea perdida no debe desplazar para siempre las respuestas siguientes.
+        """
+        horizon = time.monotonic() - 4 * self.ack_timeout
+        while self._expired and self._expired[0] < horizon:
+            self._expired.popleft()
+        if not self._expired:
+            return False
+        self._expired.popleft()
+        return True
+
+    def _complete(self, command, acked):
+        latency_ms = (time.monotonic() - command.enqueued_at) * 1000.0
+        if acked:
+            with self._metrics_lock:
+                self._metrics['acked'] += 1
+                count = self._metrics['acked']
+                self._metrics['latency_last_ms'] = latency_ms
+                self._metrics['latency_avg_ms'] += (latency_ms - self._metrics['latency_avg_ms']) / count
+                if latency_ms > self._metrics['latency_max_ms']:
+                    self._metrics['latency_max_ms'] = latency_ms
+            with self._state_lock:
+                for servo_id, angle in command.targets.items():
+                    self._last_acked[self._servo_index[servo_id]] = angle
+            self._publish(last_ack=time.time())
+        else:
+            self._count_error('ack_timeouts')
+            # Sin ACK no se sabe si el servo se movió: el siguiente intento
+            # con el mismo ángulo debe enviarse, no descartarse como "sin cambios"
+            self._release_targets(command.targets)
+        message = command.description if acked else f"{command.description} (sin confirmación)"
+        command.resolve(True, message)
+
+    def _fail_inflight(self, message):
+        """Resuelve como fallidos los comandos escritos sin respuesta"""
+        while self._inflight:
+            self._inflight.popleft().resolve(False, message)
+        self._expired.clear()
+        self.protocol.reset()
+
+    def get_metrics(self):
+        """Contadores de la cola de comandos y latencias por comando"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['inflight'] = len(self._inflight)
+        metrics['coalesce_pending'] = len(self._coalesced)
+        metrics['queue_capacity'] = self._queue.maxsize
+        metrics['protocol'] = self.protocol.name
+        return metrics
+
+    def reset_servos(self, group_size=None, interval=None):
+        """Lleva todos los servos a su posición "home" (90° si no se configuró otra)
+
+        Por defecto es una única escritura con todas las posiciones. Con
+        group_size > 0 el reset se escalona en grupos separados por interval
+        segundos para repartir el consumo; los grupos siguientes los envía un
+        hilo aparte, así que la llamada nunca bloquea.
+        """
+        group_size = max(0, int(self.reset_group_size if group_size is None else group_size))
+        interval = max(0.0, float(self.reset_interval if interval is None else interval))
+        targets = [(servo_id, self.home_angles.get(servo_id, 90)) for servo_id in self.servo_pins]
+
+        if not group_size or group_size >= len(targets):
+            future = self.queue_servos(targets, force=True)
+            if future.done():
+                return future.result()
+            return True, f"Reset de {len(targets)} servos enviado"
+
+        groups = [targets[i:i + group_size] for i in range(0, len(targets), group_size)]
+        future = self.queue_servos(groups[0], force=True)
+        if future.done() and not future.result()[0]:
+            return future.result()
+        threading.Thread(target=self._staggered_reset,
+                         args=(groups[1:], interval),
+                         name='arduino-reset',
+                         daemon=True).start()
+        return True, f"Reset escalonado en {len(groups)} grupos cada {interval}s"
+
+    def _staggered_reset(self, groups, interval):
+        for group in groups:
+            time.sleep(interval)
+            success, message = self.queue_servos(group, force=True).result()
+            if not success:
+                logger.warning(f"Reset escalonado interrumpido: {message}")
+                return
+
+    def get_throughput(self):
+        """Bytes/s medidos en el enlace desde la última conexión"""
+        metrics = self.get_metrics()
+        elapsed = time.monotonic() - self._connected_at if self._connected_at else 0
+        tx_rate = metrics['bytes_tx'] / elapsed if elapsed else 0.0
+        rx_rate = metrics['bytes_rx'] / elapsed if elapsed else 0.0
+        # 8N1: 10 bits por byte en el cable
+        capacity = self.link_baud_rate / 10 if self.link_baud_rate else 0
+        return {
+            'baud_rate_enlace': self.link_baud_rate,
+            'tx_bytes_s': round(tx_rate, 1),
+            'rx_bytes_s': round(rx_rate, 1),
+            'capacidad_bytes_s': capacity,
+            'uso_enlace_pct': round(100.0 * max(tx_rate, rx_rate) / capacity, 2) if capacity else 0.0,
+        }
 
-        # Enviar el comando a Arduino
-        command = f"{servo_id},{angle}\n"
-        logger.debug(f"Enviando comando: {command}")
-        
-        with self.lock:
-            if not self.is_connected():
-                if not self.connect():
-                    return False, "Arduino no conectado"
-            
-            try:
-                self.arduino.write(command.encode())  # Enviar a Arduino
-                # Wait brief time for response
-                time.sleep(0.1)
-                if self.arduino.in_waiting > 0:
-                    response = self.arduino.readline().decode().strip()
-                    logger.debug(f"Respuesta Arduino: {response}")
-                return True, f"Servo {servo_id} movido a posición {angle}"
-            except Exception as e:
-                logger.error(f"Error enviando comando: {str(e)}")
-                return False, f"Error: {str(e)}"
-
-    def reset_servos(self):
-        """Resetea todos los servos a posición central"""
-        success = True
-        messages = []
-        
-        for servo_id in self.servo_pins:
-            result, message = self.set_servo(servo_id, 90)
-            if not result:
-                success = False
-            messages.append(message)
-            
-        return success, messages
-        
     def get_diagnostics(self):
         """Returns diagnostic information about the controller"""
         diagnostics = {
             "configuracion_actual": {
                 "puerto_configurado": self.port if self.port else "No configurado",
                 "baud_rate": self.baud_rate,
-                "estado_conexion": "Conectado" if self.is_connected() else "Desconectado"
+                "baud_rate_candidatos": self.baud_candidates,
+                "estado_conexion": "Conectado" if self._status['connected'] else "Desconectado"
             },
+            "estado": self.get_status(),
             "puertos_disponibles": self.get_available_ports(),
+            "cola_comandos": self.get_metrics(),
+            "rendimiento_enlace": self.get_throughput(),
             "info_adicional": {}
         }
-        
+
         return diagnostics
 
 # Singleton para usar en toda la aplicación
 arduino_controller = None
-def init_arduino(port="COM12", baud_rate=9600):
+def init_arduino(port="COM12", baud_rate=9600, **options):
     """Inicializa el controlador de Arduino como singleton"""
     global arduino_controller
     try:
         if arduino_controller is None:
             logger.info(f"Inicializando ArduinoController con port={port}, baud_rate={baud_rate}")
-            arduino_controller = ArduinoController(port, baud_rate)
-            
-            # Try to connect immediately once during initialization
-            if port:
-                connect_result = arduino_controller.connect()
-                logger.info(f"Resultado de conexión inicial: {'Éxito' if connect_result else 'Falló'}")
-            
+            arduino_controller = ArduinoController(port, baud_rate, **options)
+
+            # La conexión la abre el supervisor en segundo plano: el arranque
+            # de la app no espera al puerto serie (ni al reset del Arduino)
+            arduino_controller.start()
+
         return arduino_controller
     except Exception as e:
         logger.error(f"Error al inicializar ArduinoController: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_arduino():
+    """Devuelve el singleton actual (los módulos que lo importaron por nombre
+    se quedarían con el valor None que tenía al importarse)"""
+    return arduino_controller if arduino_controller is not None else init_arduino()
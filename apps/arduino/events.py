@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+
+import threading
+
+
+class EventChannel:
+    """Buzón de eventos de un cliente: se guarda solo lo último de cada tipo
+
+    Un navegador lento no acumula eventos: recibe el estado más reciente y,
+    para los tipos con merge, los cambios acumulados en un único dict.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._closed = False
+
+    def offer(self, kind, data, merge=False):
+        with self._cond:
+            if merge and kind in self._pending:
+                self._pending[kind].update(data)
+            else:
+                self._pending[kind] = dict(data) if merge else data
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """[(tipo, datos)] pendientes; [] si venció el timeout, None si se cerró"""
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(timeout)
+            if self._closed:
+                return None
+            events, self._pending = list(self._pending.items()), {}
+            return events
+
+
+class EventHub:
+    """Reparte eventos del controlador a los canales suscritos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = set()
+
+    def subscribe(self):
+        channel = EventChannel()
+        with self._lock:
+            self._channels.add(channel)
+        return channel
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            self._channels.discard(channel)
+        channel.close()
+
+    def publish(self, kind, data, merge=False):
+        if not self._channels:
+            return  # Sin navegadores conectados no cuesta nada
+        with self._lock:
+            channels = list(self._channels)
+        for channel in channels:
+            channel.offer(kind, data, merge)
+
+    def __len__(self):
+        return len(self._channels)
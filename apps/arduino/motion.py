@@ -0,0 +1,240 @@
+# -*- encoding: utf-8 -*-
+
+import time
+import logging
+import threading
+
+import numpy as np
+
+from apps.arduino.controller import get_arduino
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('linear', 'ease', 'min_jerk')
+
+# Velocidad pico / velocidad media de cada perfil, para respetar max_velocity
+PEAK_FACTOR = np.array([1.0, np.pi / 2, 1.875])
+
+
+def _profile_positions(s, profile):
+    """Fracción recorrida (0-1) para el tiempo normalizado s, por servo"""
+    linear = s
+    ease = (1 - np.cos(np.pi * s)) / 2
+    min_jerk = s ** 3 * (10 - 15 * s + 6 * s ** 2)
+    return np.choose(profile, (linear, ease, min_jerk))
+
+
+class MotionPlanner:
+    """Planificador de trayectorias: un movimiento pedido, muchos puntos enviados
+
+    Guarda para cada servo inicio, destino, instante de salida, duración y
+    perfil en arrays; un único hilo calcula en cada tick los puntos de todos
+    los servos en movimiento a la vez y envía en una sola trama los que
+    cambiaron de grado.
+    """
+
+    def __init__(self, tick_hz=50.0, profile='min_jerk', max_velocity=180.0):
+        self.tick_hz = tick_hz
+        self.default_profile = profile if profile in PROFILES else 'min_jerk'
+        self.max_velocity = max_velocity
+        self.pins = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._metrics = {'moves': 0, 'ticks': 0, 'frames': 0, 'setpoints': 0, 'errors': 0,
+                         'last_error': None}
+
+    def _ensure_state(self, controller):
+        """Arrays por servo, indexados según controller.servo_pins"""
+        if self.pins is not None:
+            return
+        self.pins = list(controller.servo_pins)
+        self._index = {pin: index for index, pin in enumerate(self.pins)}
+        size = len(self.pins)
+        home = np.array([controller.home_angles.get(pin, 90) for pin in self.pins], dtype=np.float64)
+        self._start = home.copy()
+        self._goal = home.copy()
+        self._position = home.copy()
+        self._sent = np.full(size, -1, dtype=np.int64)
+        self._t0 = np.zeros(size)
+        self._duration = np.ones(size)
+        self._profile = np.zeros(size, dtype=np.int64)
+        self._active = np.zeros(size, dtype=bool)
+
+    def move(self, targets, duration=None, max_velocity=None, profile=None):
+        """Planifica un movimiento suave.
+
+        targets: lista de dicts {servo_id, angle[, duration][, max_velocity]};
+        duration/max_velocity generales se aplican a los servos que no traen
+        los suyos. Si la duración pedida obligaría a superar la velocidad
+        máxima, se alarga. Devuelve (éxito, mensaje, {servo_id: duración}).
+        """
+        profile = profile or self.default_profile
+        if profile not in PROFILES:
+            return False, f"Perfil desconocido, usa uno de {', '.join(PROFILES)}", {}
+        error = self._check_timing(duration, max_velocity)
+        if error:
+            return False, error, {}
+        controller = get_arduino()
+        if controller is None:
+            return False, "Arduino controller not initialized", {}
+
+        with self._lock:
+            self._ensure_state(controller)
+            plan = []
+            for target in targets:
+                servo_id = int(target['servo_id'])
+                angle = float(target['angle'])
+                if servo_id not in self._index:
+                    return False, f"Servo {servo_id}: ID de servo inválido", {}
+                if not (0 <= angle <= 180):
+                    return False, f"Servo {servo_id}: Ángulo fuera de rango (0-180)", {}
+                error = self._check_timing(target.get('duration'), target.get('max_velocity'))
+                if error:
+                    return False, f"Servo {servo_id}: {error}", {}
+                servo_velocity = target.get('max_velocity', max_velocity)
+                plan.append((self._index[servo_id], angle,
+                             target.get('duration', duration),
+                             servo_velocity if servo_velocity is not None else self.max_velocity))
+            if not plan:
+                return False, "No se indicó ningún servo", {}
+
+            indexes = np.array([item[0] for item in plan])
+            goals = np.array([item[1] for item in plan])
+            requested = np.array([item[2] if item[2] is not None else 0.0 for item in plan], dtype=np.float64)
+            velocities = np.array([item[3] for item in plan], dtype=np.float64)
+
+            # Salir desde donde va el servo ahora, aunque esté a mitad de otro
+            # movimiento; si está quieto, desde el último ángulo que conoce el controlador
+            for index in indexes[~self._active[indexes]]:
+                known = controller.get_servo_angle(self.pins[index])
+                if known is not None:
+                    self._position[index] = known
+            code = PROFILES.index(profile)
+            starts = self._position[indexes]
+            minimum = np.abs(goals - starts) * PEAK_FACTOR[code] / np.maximum(velocities, 1e-6)
+            durations = np.maximum(np.maximum(requested, minimum), 1.0 / self.tick_hz)
+
+            self._start[indexes] = starts
+            self._goal[indexes] = goals
+            self._t0[indexes] = time.monotonic()
+            self._duration[indexes] = durations
+            self._profile[indexes] = code
+            self._active[indexes] = True
+            self._metrics['moves'] += 1
+            self._ensure_thread()
+
+        self._wake.set()
+        plan_info = {self.pins[index]: round(float(seconds), 3) for index, seconds in zip(indexes, durations)}
+        return True, f"{len(plan)} servos en movimiento ({profile})", plan_info
+
+    @staticmethod
+    def _check_timing(duration, max_velocity):
+        """Mensaje de error si la duración o la velocidad no tienen sentido, si no None"""
+        if duration is not None and not (np.isfinite(duration) and duration >= 0):
+            return "La duración debe ser >= 0 segundos"
+        if max_velocity is not None and not (np.isfinite(max_velocity) and max_velocity > 0):
+            return "La velocidad máxima debe ser > 0 grados/s"
+        return None
+
+    def stop(self):
+        """Detiene todos los movimientos en el punto en que van"""
+        with self._lock:
+            if self.pins is None:
+                return True, "No hay movimientos en curso"
+            moving = int(self._active.sum())
+            self._goal[:] = self._position
+            self._active[:] = False
+        return True, f"{moving} servos detenidos"
+
+    def get_status(self):
+        with self._lock:
+            status = dict(self._metrics)
+            status['tick_hz'] = self.tick_hz
+            status['profile'] = self.default_profile
+            if self.pins is None:
+                status['moving'] = {}
+            else:
+                status['moving'] = {self.pins[index]: {
+                    'position': round(float(self._position[index]), 1),
+                    'goal': float(self._goal[index]),
+                } for index in np.flatnonzero(self._active)}
+        return status
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='arduino-motion', daemon=True)
+            self._thread.start()
+
+    def _tick(self, now):
+        """Calcula los puntos de todos los servos activos
+
+        Devuelve ([(pin, ángulo)], índices, ángulos) con los que cambiaron, o []
+        """
+        with self._lock:
+            active = self._active
+            if not active.any():
+                return []
+            s = np.clip((now - self._t0[active]) / self._duration[active], 0.0, 1.0)
+            fraction = _profile_positions(s, self._profile[active])
+            start = self._start[active]
+            self._position[active] = start + (self._goal[active] - start) * fraction
+
+            setpoints = np.rint(self._position).astype(np.int64)
+            changed = active & (setpoints != self._sent)
+            self._active[np.flatnonzero(active)[s >= 1.0]] = False
+            self._metrics['ticks'] += 1
+            if not changed.any():
+                return []
+            indexes = np.flatnonzero(changed)
+            return [(self.pins[index], int(setpoints[index])) for index in indexes], indexes, setpoints[indexes]
+
+    def _run(self):
+        period = 1.0 / self.tick_hz
+        next_tick = time.monotonic()
+        while True:
+            with self._lock:
+                idle = not self._active.any()
+            if idle:
+                # Sin movimientos no se gasta CPU: se espera al siguiente move()
+                self._wake.wait()
+                self._wake.clear()
+                next_tick = time.monotonic()
+
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick = max(next_tick + period, time.monotonic())
+
+            try:
+                result = self._tick(time.monotonic())
+                if not result:
+                    continue
+                positions, indexes, setpoints = result
+                success, message = get_arduino().set_servos(positions)
+                with self._lock:
+                    if success:
+                        self._sent[indexes] = setpoints
+                        self._metrics['frames'] += 1
+                        self._metrics['setpoints'] += len(positions)
+                    else:
+                        self._metrics['errors'] += 1
+                        self._metrics['last_error'] = message
+            except Exception as e:
+                logger.error(f"Error en el planificador de movimiento: {str(e)}")
+                with self._lock:
+                    self._metrics['errors'] += 1
+                    self._metrics['last_error'] = str(e)
+
+
+# Singleton, igual que el controlador
+motion_planner = None
+def init_motion(**options):
+    global motion_planner
+    if motion_planner is None:
+        motion_planner = MotionPlanner(**options)
+    return motion_planner
+
+
+def get_motion():
+    return motion_planner if motion_planner is not None else init_motion()
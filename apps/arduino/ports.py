@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import time
+import threading
+import logging
+import serial.tools.list_ports
+
+logger = logging.getLogger(__name__)
+
+
+class PortRegistry:
+    """Caché compartida de la enumeración de puertos serie
+
+    comports() recorre sysfs en Linux y es lento con muchos dispositivos USB,
+    así que el resultado se reutiliza durante ttl segundos. Además se invalida
+    en cuanto cambia /dev/serial/by-id (el mtime del directorio cambia al
+    enchufar o quitar un dispositivo) o, si pyudev está instalado, con los
+    eventos de udev del subsistema tty.
+    """
+
+    def __init__(self, ttl=5.0, watch_dir='/dev/serial/by-id'):
+        self.ttl = ttl
+        self.watch_dir = watch_dir
+        self._lock = threading.Lock()
+        self._ports = None
+        self._fetched_at = 0.0
+        self._dir_stamp = None
+        self._observer = None
+        self.refreshes = 0
+
+    def configure(self, ttl=None, watch=True):
+        if ttl is not None:
+            self.ttl = ttl
+        if watch:
+            self.start_watching()
+
+    def start_watching(self):
+        """Invalida la caché con eventos de udev (solo si pyudev está disponible)"""
+        if self._observer is not None:
+            return True
+        try:
+            import pyudev
+        except ImportError:
+            return False
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem='tty')
+            self._observer = pyudev.MonitorObserver(monitor, lambda action, device: self.invalidate(),
+                                                    name='serial-ports-udev')
+            self._observer.daemon = True
+            self._observer.start()
+            logger.info("Vigilando puertos serie con udev")
+            return True
+        except Exception as e:
+            logger.warning(f"No se pudo vigilar udev: {str(e)}")
+            return False
+
+    def invalidate(self):
+        self._fetched_at = 0.0
+
+    def _watch_stamp(self):
+        try:
+            return os.stat(self.watch_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def list(self, refresh=False):
+        """Lista de {'device', 'description', 'hwid'}; no modificar el resultado"""
+        stamp = self._watch_stamp()
+        if not refresh and self._is_fresh(stamp):
+            return self._ports
+
+        with self._lock:
+            # Otro hilo pudo refrescar mientras se esperaba el lock
+            if not refresh and self._is_fresh(stamp):
+                return self._ports
+            ports = []
+            for port in serial.tools.list_ports.comports():
+                ports.append({
+                    'device': port.device,
+                    'description': port.description,
+                    'hwid': port.hwid
+                })
+            self._ports = ports
+            self._dir_stamp = stamp
+            self._fetched_at = time.monotonic()
+            self.refreshes += 1
+            return ports
+
+    def _is_fresh(self, stamp):
+        return (self._ports is not None
+                and stamp == self._dir_stamp
+                and time.monotonic() - self._fetched_at < self.ttl)
+
+
+# Registro compartido por el controlador y las rutas de diagnóstico
+port_registry = PortRegistry()
@@ -0,0 +1,110 @@
+# -*- encoding: utf-8 -*-
+
+"""Formatos de trama entre el servidor y el sketch Codigo_arduino.ino
+
+ASCII (por defecto): "id,ángulo\\n" o "id,ángulo;id,ángulo\\n", una línea de
+respuesta por trama.
+
+Binario (se negocia con "PROTO,BIN\\n" y el Arduino responde "PROTO BIN"):
+    0xA5 seq índice ángulo xor                      un servo (5 bytes)
+    0xA6 seq n (índice ángulo)*n xor                varios servos
+    0xA7 seq ángulo*30 xor                          todos los servos (33 bytes)
+y el Arduino contesta cada trama con
+    0x5A seq estado xor                             estado 0 = OK
+El índice es la posición del servo en servo_pins (pin - 2) y xor es el
+XOR de todos los bytes anteriores de la trama.
+"""
+
+SYNC_SINGLE = 0xA5
+SYNC_BATCH = 0xA6
+SYNC_FULL = 0xA7
+SYNC_ACK = 0x5A
+
+ACK_STATUS = {
+    0: 'OK',
+    1: 'checksum incorrecto',
+    2: 'servo o ángulo inválido',
+}
+
+
+def checksum(data):
+    value = 0
+    for byte in data:
+        value ^= byte
+    return value
+
+
+class AsciiProtocol:
+    """Texto "id,ángulo" separado por ';'; las respuestas se emparejan en orden"""
+
+    name = 'ascii'
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def encode(self, targets, seq):
+        return (";".join(f"{servo_id},{angle}" for servo_id, angle in targets.items()) + "\n").encode()
+
+    def feed(self, data):
+        """Devuelve [(seq, ok, texto)] por cada línea completa; seq es siempre None"""
+        self._buffer += data
+        replies = []
+        while b'\n' in self._buffer:
+            line, _, rest = self._buffer.partition(b'\n')
+            self._buffer = bytearray(rest)
+            replies.append((None, True, line.decode(errors='replace').strip()))
+        return replies
+
+    def expected_reply(self, targets):
+        """Línea con la que el firmware confirma la trama (ver Codigo_arduino.ino)"""
+        if len(targets) == 1:
+            servo_id, angle = next(iter(targets.items()))
+            return f"Servo {servo_id} ajustado a {angle}°"
+        return f"Servos ajustados: {len(targets)}"
+
+    def reset(self):
+        self._buffer.clear()
+
+
+class BinaryProtocol:
+    """Paquetes de tamaño fijo con número de secuencia y checksum"""
+
+    name = 'binary'
+
+    def __init__(self, servo_pins):
+        self.servo_pins = list(servo_pins)
+        self._index = {servo_id: index for index, servo_id in enumerate(self.servo_pins)}
+        self._buffer = bytearray()
+
+    def encode(self, targets, seq):
+        seq &= 0xFF
+        if len(targets) == len(self.servo_pins):
+            # Trama completa: los ángulos van en el orden de servo_pins
+            packet = bytearray([SYNC_FULL, seq])
+            packet += bytes(targets[servo_id] for servo_id in self.servo_pins)
+        elif len(targets) == 1:
+            servo_id, angle = next(iter(targets.items()))
+            packet = bytearray([SYNC_SINGLE, seq, self._index[servo_id], angle])
+        else:
+            packet = bytearray([SYNC_BATCH, seq, len(targets)])
+            for servo_id, angle in targets.items():
+                packet += bytes((self._index[servo_id], angle))
+        packet.append(checksum(packet))
+        return bytes(packet)
+
+    def feed(self, data):
+        """Devuelve [(seq, ok, texto)] por cada ACK válido; descarta ruido"""
+        self._buffer += data
+        replies = []
+        while len(self._buffer) >= 4:
+            if self._buffer[0] != SYNC_ACK or checksum(self._buffer[:3]) != self._buffer[3]:
+                # Resincronizar: tirar un byte y volver a buscar la cabecera
+                del self._buffer[0]
+                continue
+            _, seq, status, _ = self._buffer[:4]
+            del self._buffer[:4]
+            replies.append((seq, status == 0, ACK_STATUS.get(status, f'estado {status}')))
+        return replies
+
+    def reset(self):
+        self._buffer.clear()
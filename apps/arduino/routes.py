@@ -1,79 +1,150 @@
 # -*- encoding: utf-8 -*-
 
 from apps.arduino import blueprint
-from flask import request, jsonify
-from flask_login import login_required
-from apps.arduino.controller import arduino_controller, init_arduino
+from flask import request, jsonify, current_app
+from flask_login import login_required, current_user
+from apps.arduino.controller import get_arduino, init_arduino
+from apps.arduino.ports import port_registry
+from apps.arduino.teleop import get_teleop
+from apps.arduino.motion import get_motion
+from apps.streams import stream_response
+from apps.authentication.models import revoke_api_tokens
+from apps.authentication.tokens import api_tokens
 import serial
-import serial.tools.list_ports
+import json
+import time
+
+def connection_summary(state):
+    """Resumen de la instantánea del controlador que muestran las páginas"""
+    if state.get('connected'):
+        return {
+            'status': 'connected',
+            'port': state['port'],
+            'last_ack': state['last_ack']
+        }
+    elif state.get('connecting'):
+        return {
+            'status': 'connecting',
+            'port': state['port']
+        }
+    else:
+        return {
+            'status': 'disconnected',
+            'last_error': state.get('last_error')
+        }
 
 @blueprint.route('/status')
 @login_required
 def status():
-    """Devuelve el estado de la conexión con Arduino"""
+    """Devuelve el estado de la conexión con Arduino (instantánea, sin tocar el puerto)"""
     # Ensure controller is initialized
+    arduino_controller = get_arduino()
+    state = arduino_controller.get_status() if arduino_controller else {}
+    return jsonify(connection_summary(state))
+
+def sse_event(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@blueprint.route('/events')
+@login_required
+def events():
+    """Server-Sent Events con el estado de la conexión ('status') y los objetivos
+    de los servos ('servos'); una sola conexión por pestaña en vez de sondear"""
+    arduino_controller = get_arduino()
+
     if arduino_controller is None:
-        init_arduino()
-        
-    if arduino_controller and arduino_controller.is_connected():
-        return jsonify({
-            'status': 'connected',
-            'port': arduino_controller.port
-        })
-    else:
         return jsonify({
-            'status': 'disconnected'
-        })
+            'status': 'error',
+            'message': 'Arduino controller not initialized'
+        }), 500
+
+    interval = current_app.config.get('ARDUINO_EVENTS_INTERVAL', 0.1)
+
+    def stream():
+        # Suscribirse antes de leer el estado inicial para no perder cambios
+        channel = arduino_controller.subscribe_events()
+        try:
+            yield sse_event('status', connection_summary(arduino_controller.get_status()))
+            yield sse_event('servos', arduino_controller.get_servo_targets())
+            while True:
+                events = channel.take(timeout=15.0)
+                if events is None:
+                    return
+                if not events:
+                    yield ': ping\n\n'  # Mantener viva la conexión a través de proxies
+                    continue
+                for kind, data in events:
+                    if kind == 'status':
+                        data = connection_summary(data)
+                    yield sse_event(kind, data)
+                # Lo que llegue mientras tanto se agrupa en el siguiente envío
+                time.sleep(interval)
+        finally:
+            arduino_controller.unsubscribe_events(channel)
+
+    # Ocupa un hilo mientras la pestaña siga abierta: cuenta en MAX_STREAMS
+    return stream_response(stream, mimetype='text/event-stream',
+                           headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @blueprint.route('/connect', methods=['POST'])
 @login_required
 def connect():
-    """Intenta conectar con Arduino"""
+    """Pide conectar con Arduino; la conexión la abre el supervisor en segundo plano"""
     # Ensure controller is initialized
-    if arduino_controller is None:
-        init_arduino()
+    arduino_controller = get_arduino()
         
     data = request.json or {}
+
+    # La velocidad llega tal cual del JSON: "115200" rompería la negociación
+    baud_rate = data.get('baud_rate')
+    try:
+        baud_rate = int(baud_rate) if baud_rate is not None else None
+    except (ValueError, TypeError):
+        baud_rate = 0
+    if baud_rate is not None and baud_rate <= 0:
+        return jsonify({
+            'status': 'error',
+            'message': 'baud_rate debe ser un entero positivo'
+        }), 400
     
     if arduino_controller is None:
         # If still None after init attempt, use defaults
-        port = data.get('port', 'COM12')
-        baud_rate = data.get('baud_rate', 9600)
+        port = data.get('port') or 'COM12'
+        baud_rate = baud_rate or 9600
         # Try to initialize with the given port
-        init_arduino(port=port, baud_rate=baud_rate)
+        arduino_controller = init_arduino(port=port, baud_rate=baud_rate)
     else:
         # Normal case - controller exists
-        port = data.get('port', arduino_controller.port)
-        baud_rate = data.get('baud_rate', arduino_controller.baud_rate)
-        
-        # Update settings if needed
-        if port != arduino_controller.port:
-            arduino_controller.port = port
-        if baud_rate != arduino_controller.baud_rate:
-            arduino_controller.baud_rate = baud_rate
-    
-    # Try to connect
-    success = arduino_controller.connect() if arduino_controller else False
-    
-    if success:
-        return jsonify({
-            'status': 'success',
-            'message': f'Conectado a Arduino en {port}'
-        })
-    else:
+        port = data.get('port') or arduino_controller.port
+        baud_rate = baud_rate or arduino_controller.baud_rate
+
+    if arduino_controller is None:
         return jsonify({
             'status': 'error',
             'message': 'No se pudo conectar con Arduino'
         }), 500
 
+    unchanged = port == arduino_controller.port and baud_rate == arduino_controller.baud_rate
+    if unchanged and arduino_controller.is_connected():
+        return jsonify({
+            'status': 'success',
+            'message': f'Conectado a Arduino en {port}'
+        })
+
+    # No se espera al puerto: el cliente consulta /status para ver el resultado
+    arduino_controller.request_connect(port=port, baud_rate=baud_rate)
+    return jsonify({
+        'status': 'connecting',
+        'message': f'Conectando a Arduino en {port}...'
+    }), 202
+
 @blueprint.route('/set_servo', methods=['POST'])
 @login_required
 def set_servo():
     """Controla un servo específico"""
     try:
         # Ensure controller is initialized
-        if arduino_controller is None:
-            init_arduino()
+        arduino_controller = get_arduino()
             
         # If still None, return error
         if arduino_controller is None:
@@ -86,8 +157,10 @@ def set_servo():
         data = request.json
         servo_id = int(data['servo_id'])
         angle = int(data['angle'])
+        # Opcional: esperar la confirmación del Arduino en vez de solo encolar
+        wait = bool(data.get('wait', False))
         
-        success, message = arduino_controller.set_servo(servo_id, angle)
+        success, message = arduino_controller.set_servo(servo_id, angle, wait=wait, timeout=2.0)
         
         if success:
             return jsonify({
@@ -113,13 +186,110 @@ def set_servo():
             'message': str(e)
         }), 500
 
+@blueprint.route('/set_servos', methods=['POST'])
+@login_required
+def set_servos():
+    """Controla varios servos en una sola petición y una sola escritura serie"""
+    try:
+        arduino_controller = get_arduino()
+
+        if arduino_controller is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Arduino controller not initialized'
+            }), 500
+
+        # Acepta {"servos": [{"servo_id": 2, "angle": 90}, ...]} o la lista directamente
+        data = request.json
+        items = data.get('servos', []) if isinstance(data, dict) else data
+        positions = [(int(item['servo_id']), int(item['angle'])) for item in items]
+        wait = bool(data.get('wait', False)) if isinstance(data, dict) else False
+
+        success, message = arduino_controller.set_servos(positions, wait=wait, timeout=2.0)
+
+        if success:
+            return jsonify({
+                'status': 'success',
+                'servos': [{'servo_id': servo_id, 'angle': angle} for servo_id, angle in positions],
+                'message': message
+            })
+        else:
+            return jsonify({
+                'status': 'error',
+                'message': message
+            }), 400
+
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Datos inválidos, envía una lista de {servo_id, angle} numéricos'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@blueprint.route('/api_token', methods=['POST'])
+@login_required
+def api_token():
+    """Emite un token para la API /api/arduino (cabecera Authorization: Bearer <token>)"""
+    data = request.get_json(silent=True) or {}
+    max_ttl = current_app.config.get('API_TOKEN_TTL', 30 * 24 * 3600)
+    try:
+        ttl = int(data.get('ttl', max_ttl))
+    except (ValueError, TypeError):
+        return jsonify({
+            'status': 'error',
+            'message': 'ttl debe ser un número de segundos'
+        }), 400
+    if ttl <= 0:
+        return jsonify({
+            'status': 'error',
+            'message': 'ttl debe ser mayor que 0: los tokens siempre caducan'
+        }), 400
+    ttl = min(ttl, max_ttl)
+
+    return jsonify({
+        'status': 'success',
+        'token': api_tokens.issue(current_user.id, current_user.api_token_version, ttl=ttl),
+        'expires_in': ttl
+    })
+
+@blueprint.route('/api_token/revoke', methods=['POST'])
+@login_required
+def revoke_api_token():
+    """Revoca todos los tokens de API del usuario actual"""
+    revoke_api_tokens(current_user.id)
+    return jsonify({
+        'status': 'success',
+        'message': 'Tokens de API revocados'
+    })
+
+@blueprint.route('/servos')
+@login_required
+def servos():
+    """Estado de todos los servos según el servidor (para sincronizar las pestañas)"""
+    arduino_controller = get_arduino()
+
+    if arduino_controller is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Arduino controller not initialized'
+        }), 500
+
+    return jsonify({
+        'status': 'success',
+        'connected': arduino_controller.get_status().get('connected', False),
+        'servos': arduino_controller.get_servo_state()
+    })
+
 @blueprint.route('/reset_servos', methods=['POST'])
 @login_required
 def reset_servos():
     """Resetea todos los servos a posición central"""
     # Ensure controller is initialized
-    if arduino_controller is None:
-        init_arduino()
+    arduino_controller = get_arduino()
         
     # If still None, return error
     if arduino_controller is None:
@@ -128,61 +298,183 @@ def reset_servos():
             'message': 'Arduino controller not initialized'
         }), 500
         
-    success, messages = arduino_controller.reset_servos()
+    # Opcional: {"group_size": 5, "interval": 0.2} para un reset escalonado
+    data = request.get_json(silent=True) or {}
+    try:
+        group_size = data.get('group_size')
+        group_size = int(group_size) if group_size is not None else None
+        interval = data.get('interval')
+        interval = float(interval) if interval is not None else None
+    except (ValueError, TypeError):
+        return jsonify({
+            'status': 'error',
+            'message': 'group_size e interval deben ser números'
+        }), 400
+    if (group_size is not None and group_size < 0) or (interval is not None and not 0 <= interval <= 10):
+        return jsonify({
+            'status': 'error',
+            'message': 'group_size debe ser >= 0 e interval estar entre 0 y 10 segundos'
+        }), 400
+        
+    success, message = arduino_controller.reset_servos(group_size=group_size, interval=interval)
     
     if success:
         return jsonify({
             'status': 'success',
-            'message': 'Todos los servos han sido reseteados'
+            'message': 'Todos los servos han sido reseteados',
+            'details': message,
+            'servos': [{'servo_id': servo_id, 'angle': arduino_controller.home_angles.get(servo_id, 90)}
+                       for servo_id in arduino_controller.servo_pins]
         })
     else:
         return jsonify({
             'status': 'error',
             'message': 'Error al resetear algunos servos',
-            'details': messages
+            'details': message
         }), 500
         
-        
-        import serial.tools.list_ports
 
+@blueprint.route('/move', methods=['POST'])
+@login_required
+def move():
+    """Movimiento suave: el servidor interpola y envía los puntos intermedios
+
+    {"servos": [{"servo_id": 2, "angle": 120, "duration": 1.5, "max_velocity": 60}, ...],
+     "duration": 1.0, "max_velocity": 90, "profile": "min_jerk"}
+    """
+    try:
+        data = request.json
+        items = data.get('servos', []) if isinstance(data, dict) else data
+        options = data if isinstance(data, dict) else {}
+        targets = []
+        for item in items:
+            target = {'servo_id': int(item['servo_id']), 'angle': float(item['angle'])}
+            if item.get('duration') is not None:
+                target['duration'] = float(item['duration'])
+            if item.get('max_velocity') is not None:
+                target['max_velocity'] = float(item['max_velocity'])
+            targets.append(target)
+        duration = float(options['duration']) if options.get('duration') is not None else None
+        max_velocity = float(options['max_velocity']) if options.get('max_velocity') is not None else None
+
+        success, message, plan = get_motion().move(targets, duration=duration,
+                                                   max_velocity=max_velocity,
+                                                   profile=options.get('profile'))
+        if success:
+            return jsonify({
+                'status': 'success',
+                'message': message,
+                'durations': plan
+            })
+        else:
+            return jsonify({
+                'status': 'error',
+                'message': message
+            }), 400
+
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Datos inválidos, envía una lista de {servo_id, angle} numéricos'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@blueprint.route('/move/stop', methods=['POST'])
+@login_required
+def move_stop():
+    """Detiene los movimientos en curso donde estén"""
+    success, message = get_motion().stop()
+    return jsonify({
+        'status': 'success' if success else 'error',
+        'message': message
+    })
+
+@blueprint.route('/move/status')
+@login_required
+def move_status():
+    """Servos en movimiento y contadores del planificador"""
+    return jsonify(get_motion().get_status())
+
+@blueprint.route('/teleop/start', methods=['POST'])
+@login_required
+def teleop_start():
+    """Empieza a mover los servos con la pose detectada por una cámara"""
+    data = request.get_json(silent=True) or {}
+    try:
+        camera_id = int(data['camera_id']) if data.get('camera_id') is not None else None
+    except (ValueError, TypeError):
+        return jsonify({
+            'status': 'error',
+            'message': 'camera_id debe ser un número'
+        }), 400
+
+    success, message = get_teleop().start(camera_id)
+    if success:
+        return jsonify({
+            'status': 'success',
+            'message': message,
+            'teleop': get_teleop().get_status()
+        })
+    else:
+        return jsonify({
+            'status': 'error',
+            'message': message
+        }), 500
+
+@blueprint.route('/teleop/stop', methods=['POST'])
+@login_required
+def teleop_stop():
+    """Detiene la teleoperación (los servos se quedan en su última posición)"""
+    success, message = get_teleop().stop()
+    return jsonify({
+        'status': 'success' if success else 'error',
+        'message': message
+    })
+
+@blueprint.route('/teleop/status')
+@login_required
+def teleop_status():
+    """Estado y latencia de la teleoperación"""
+    return jsonify(get_teleop().get_status())
+        
 @blueprint.route('/diagnostico')
 @login_required
 def diagnostico():
     """Diagnóstico de puertos y conexión Arduino"""
     try:
-        # Importar módulo serial si no está importado
-        import serial
-        import serial.tools.list_ports
+        arduino_controller = get_arduino()
         
-        # Buscar puertos disponibles
+        # Puertos disponibles (enumeración en caché compartida)
         puertos = []
-        for p in serial.tools.list_ports.comports():
+        for p in port_registry.list(refresh=request.args.get('refresh') == '1'):
             puertos.append({
-                'dispositivo': p.device,
-                'descripcion': p.description,
-                'hwid': p.hwid
+                'dispositivo': p['device'],
+                'descripcion': p['description'],
+                'hwid': p['hwid']
             })
         
-        # Verificar configuración actual
+        # Configuración y estado desde la instantánea del controlador
+        state = arduino_controller.get_status() if arduino_controller else {}
         config_actual = {
-            'puerto_configurado': arduino_controller.port if arduino_controller else 'No inicializado',
-            'baud_rate': arduino_controller.baud_rate if arduino_controller else 'No inicializado',
-            'estado_conexion': 'Conectado' if (arduino_controller and arduino_controller.is_connected()) else 'Desconectado'
+            'puerto_configurado': state.get('port', 'No inicializado'),
+            'baud_rate': state.get('baud_rate', 'No inicializado'),
+            'estado_conexion': 'Conectado' if state.get('connected') else 'Desconectado'
         }
         
-        # Intentar información adicional
-        info_adicional = {}
-        if arduino_controller and arduino_controller.arduino:
-            try:
-                info_adicional['arduino_abierto'] = arduino_controller.arduino.is_open
-                info_adicional['arduino_nombre'] = arduino_controller.arduino.name
-                info_adicional['arduino_timeout'] = arduino_controller.arduino.timeout
-            except Exception as e:
-                info_adicional['error'] = f'No se pudo obtener información adicional: {str(e)}'
+        info_adicional = {
+            'baud_rate_enlace': state.get('link_baud_rate'),
+            'protocolo': state.get('protocol'),
+            'conectado_desde': state.get('connected_since'),
+            'ultimo_ack': state.get('last_ack'),
+            'ultimo_error': state.get('last_error'),
+            'errores': state.get('errors'),
+        }
         
-        # Verificar instalación de pyserial
-        import pkg_resources
-        pyserial_version = pkg_resources.get_distribution("pyserial").version
+        pyserial_version = serial.__version__
         
         return jsonify({
             'pyserial_version': pyserial_version,
@@ -206,8 +498,7 @@ def diagnostico():
 def diagnostics():
     """Returns detailed diagnostic information"""
     # Ensure controller is initialized
-    if arduino_controller is None:
-        init_arduino()
+    arduino_controller = get_arduino()
         
     if arduino_controller is None:
         return jsonify({
@@ -0,0 +1,306 @@
+# -*- encoding: utf-8 -*-
+
+import json
+import time
+import logging
+import threading
+
+import numpy as np
+
+from apps.arduino.controller import get_arduino
+
+logger = logging.getLogger(__name__)
+
+# Índices de MediaPipe Pose
+# 11/12 hombros, 13/14 codos, 15/16 muñecas, 23/24 caderas, 25/26 rodillas, 27/28 tobillos
+DEFAULT_JOINTS = {
+    2: (23, 11, 13),  # Hombro izquierdo
+    3: (11, 13, 15),  # Codo izquierdo
+    4: (24, 12, 14),  # Hombro derecho
+    5: (12, 14, 16),  # Codo derecho
+    6: (11, 23, 25),  # Cadera izquierda
+    7: (23, 25, 27),  # Rodilla izquierda
+    8: (12, 24, 26),  # Cadera derecha
+    9: (24, 26, 28),  # Rodilla derecha
+}
+
+
+def parse_joints(text):
+    """ "2:11-13-15;3:12-14-16:180-0" -> {pin: ((a, b, c), (min, max))}
+
+    El ángulo en b entre b→a y b→c (0-180°) se lleva linealmente a min-max;
+    un rango invertido (180-0) invierte el sentido del servo.
+    """
+    joints = {}
+    for entry in filter(None, (part.strip() for part in (text or '').split(';'))):
+        fields = entry.split(':')
+        if len(fields) not in (2, 3):
+            raise ValueError(f"Articulación inválida: {entry}")
+        landmarks = tuple(int(index) for index in fields[1].split('-'))
+        if len(landmarks) != 3 or not all(0 <= index < 33 for index in landmarks):
+            raise ValueError(f"Se esperaban tres landmarks (0-32): {entry}")
+        limits = (0, 180)
+        if len(fields) == 3:
+            limits = tuple(int(value) for value in fields[2].split('-'))
+        joints[int(fields[0])] = (landmarks, limits)
+    return joints
+
+
+def joint_angles(points, triplets, use_z=False, aspect=1.0):
+    """Ángulo en el vértice (grados) de todas las articulaciones a la vez
+
+    points: (33, 4) [x, y, z, visibility]; triplets: (J, 3) índices a, b, c.
+    aspect: ancho/alto del frame. x (y z, que MediaPipe da en la escala de x)
+    están normalizados al ancho e y al alto, así que sin escalarlos los
+    ángulos salen deformados en cualquier frame que no sea cuadrado.
+    Devuelve (ángulos, visibilidad mínima de los tres puntos), ambos (J,).
+    """
+    dims = 3 if use_z else 2
+    scale = np.array([aspect, 1.0, aspect])[:dims]
+    a = points[triplets[:, 0], :dims] * scale
+    b = points[triplets[:, 1], :dims] * scale
+    c = points[triplets[:, 2], :dims] * scale
+    v1 = a - b
+    v2 = c - b
+    norms = np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1)
+    cos = np.einsum('ij,ij->i', v1, v2) / np.maximum(norms, 1e-9)
+    angles = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+    return angles, points[triplets, 3].min(axis=1)
+
+
+class EmaFilter:
+    """Media móvil exponencial por articulación; las ocultas conservan su valor"""
+
+    def __init__(self, size, alpha=0.5):
+        self.alpha = alpha
+        self.value = np.full(size, np.nan)
+
+    def __call__(self, x, t, mask):
+        fresh = mask & np.isnan(self.value)
+        smoothed = self.alpha * x + (1 - self.alpha) * self.value
+        self.value = np.where(fresh, x, np.where(mask, smoothed, self.value))
+        return self.value
+
+
+class OneEuroFilter:
+    """Filtro One-Euro (Casiez et al.) vectorizado: suaviza mucho en reposo y
+    poco en movimientos rápidos, así que filtra el temblor sin añadir retraso"""
+
+    def __init__(self, size, min_cutoff=1.0, beta=0.02, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = np.full(size, np.nan)
+        self.derivative = np.zeros(size)
+        self._t = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, x, t, mask):
+        dt = max(t - self._t, 1e-3) if self._t is not None else None
+        self._t = t
+        fresh = mask & np.isnan(self.value)
+        if dt is None:
+            self.value = np.where(fresh, x, self.value)
+            return self.value
+
+        tracked = mask & ~fresh
+        dx = np.where(tracked, (x - self.value) / dt, 0.0)
+        a_d = self._alpha(self.d_cutoff, dt)
+        self.derivative = np.where(tracked, a_d * dx + (1 - a_d) * self.derivative, self.derivative)
+        a = self._alpha(self.min_cutoff + self.beta * np.abs(self.derivative), dt)
+        smoothed = a * x + (1 - a) * self.value
+        self.value = np.where(fresh, x, np.where(tracked, smoothed, self.value))
+        self.derivative[fresh] = 0.0
+        return self.value
+
+
+class TeleopPipeline:
+    """Teleoperación: landmarks de una cámara → ángulos de servo → Arduino
+
+    Un hilo consume el resultado más reciente de la inferencia (nunca se
+    encolan frames viejos), calcula todas las articulaciones en un paso,
+    las filtra y, como mucho rate_hz veces por segundo, envía en una sola
+    trama solo los servos que cambiaron más de deadband grados.
+    """
+
+    def __init__(self, joints=None, camera_id=0, rate_hz=30.0, deadband=1,
+                 filter='one_euro', min_cutoff=1.0, beta=0.02, alpha=0.5,
+                 min_visibility=0.5, use_z=False):
+        joints = joints or {pin: (triplet, (0, 180)) for pin, triplet in DEFAULT_JOINTS.items()}
+        self.pins = np.array(sorted(joints), dtype=np.int64)
+        self.triplets = np.array([joints[pin][0] for pin in self.pins], dtype=np.int64)
+        limits = np.array([joints[pin][1] for pin in self.pins], dtype=np.float64)
+        self.low, self.high = limits[:, 0], limits[:, 1]
+        self.camera_id = camera_id
+        self.rate_hz = rate_hz
+        self.deadband = deadband
+        self.filter_name = filter
+        self.filter_options = {'min_cutoff': min_cutoff, 'beta': beta, 'alpha': alpha}
+        self.min_visibility = min_visibility
+        self.use_z = use_z
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._subscriber = None
+        self._stop = threading.Event()
+        self._status = self._initial_status()
+
+    def _initial_status(self):
+        return {
+            'running': False,
+            'camera_id': self.camera_id,
+            'rate_hz': self.rate_hz,
+            'frames': 0,
+            'sends': 0,
+            'servos_sent': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'last_error': None,
+            'latency_last_ms': None,
+            'latency_avg_ms': None,
+            'servos': {},
+        }
+
+    def _make_filter(self):
+        size = len(self.pins)
+        if self.filter_name == 'ema':
+            return EmaFilter(size, alpha=self.filter_options['alpha'])
+        if self.filter_name == 'none':
+            return lambda x, t, mask: np.where(mask, x, np.nan)
+        return OneEuroFilter(size, min_cutoff=self.filter_options['min_cutoff'],
+                             beta=self.filter_options['beta'])
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, camera_id=None):
+        """Arranca la teleoperación; devuelve (éxito, mensaje)"""
+        if self.is_running():
+            return True, f"Teleoperación ya activa con la cámara {self.camera_id}"
+        # La primera carga importa cv2/mediapipe y tarda segundos: fuera del
+        # lock, para no bloquear get_status() mientras tanto
+        try:
+            from apps.video import get_video
+            get_camera_stream = get_video().get_camera_stream
+        except Exception as e:
+            return False, f"Video no disponible: {str(e)}"
+
+        with self._lock:
+            if self.is_running():
+                return True, f"Teleoperación ya activa con la cámara {self.camera_id}"
+            if camera_id is not None:
+                self.camera_id = camera_id
+
+            self._status = self._initial_status()
+            self._status['running'] = True
+            self._stop.clear()
+            stream = get_camera_stream(self.camera_id)
+            self._subscriber = stream.subscribe_landmarks('teleop')
+            self._thread = threading.Thread(target=self._run,
+                                            args=(stream, self._subscriber),
+                                            name='arduino-teleop',
+                                            daemon=True)
+            self._thread.start()
+        logger.info(f"Teleoperación iniciada con la cámara {self.camera_id}")
+        return True, f"Teleoperación iniciada con la cámara {self.camera_id}"
+
+    def stop(self):
+        with self._lock:
+            if not self.is_running():
+                return True, "La teleoperación no estaba activa"
+            self._stop.set()
+            self._subscriber.close()  # Despierta el take() bloqueado
+            thread = self._thread
+        thread.join(timeout=2.0)
+        return True, "Teleoperación detenida"
+
+    def get_status(self):
+        with self._lock:
+            status = dict(self._status)
+        status['running'] = self.is_running()
+        return status
+
+    def _run(self, stream, subscriber):
+        period = 1.0 / self.rate_hz
+        smooth = self._make_filter()
+        last_sent = np.full(len(self.pins), -1000, dtype=np.int64)
+        next_tick = time.monotonic()
+        latency_total = 0.0
+        try:
+            while not self._stop.is_set():
+                # Ritmo de control fijo; mientras se espera, el buzón se queda
+                # solo con el resultado más reciente
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_tick = max(next_tick + period, time.monotonic())
+
+                data = subscriber.take()
+                if data is None:
+                    break  # Se paró la teleoperación o se cerró la cámara
+                message = json.loads(data)
+                if message['landmarks'] is None:
+                    continue  # Nadie a la vista: los servos se quedan donde están
+
+                points = np.asarray(message['landmarks'], dtype=np.float64).reshape(-1, 4)
+                width, height = message.get('size') or (1, 1)
+                angles, visibility = joint_angles(points, self.triplets, self.use_z,
+                                                  aspect=width / max(height, 1))
+                filtered = smooth(angles, time.monotonic(), visibility >= self.min_visibility)
+
+                known = ~np.isnan(filtered)
+                targets = np.zeros(len(self.pins), dtype=np.int64)
+                targets[known] = np.rint(self.low[known] + (self.high[known] - self.low[known])
+                                         * filtered[known] / 180.0)
+                changed = known & (np.abs(targets - last_sent) >= self.deadband)
+
+                with self._lock:
+                    self._status['frames'] += 1
+                    if not changed.any():
+                        self._status['unchanged'] += 1
+                if not changed.any():
+                    continue
+
+                positions = list(zip(self.pins[changed].tolist(), targets[changed].tolist()))
+                success, result = get_arduino().set_servos(positions)
+                latency = (time.time() - message['t']) * 1000
+                with self._lock:
+                    status = self._status
+                    if success:
+                        last_sent[changed] = targets[changed]
+                        status['sends'] += 1
+                        status['servos_sent'] += len(positions)
+                        latency_total += latency
+                        status['latency_last_ms'] = round(latency, 1)
+                        status['latency_avg_ms'] = round(latency_total / status['sends'], 1)
+                        status['servos'] = {pin: angle for pin, angle
+                                            in zip(self.pins.tolist(), last_sent.tolist()) if angle >= 0}
+                    else:
+                        status['errors'] += 1
+                        status['last_error'] = result
+        except Exception as e:
+            logger.error(f"Error en la teleoperación: {str(e)}")
+            with self._lock:
+                self._status['last_error'] = str(e)
+        finally:
+            stream.unsubscribe(subscriber)
+            with self._lock:
+                self._status['running'] = False
+            logger.info("Teleoperación detenida")
+
+
+# Singleton, igual que el controlador
+teleop = None
+def init_teleop(**options):
+    global teleop
+    if teleop is None:
+        teleop = TeleopPipeline(**options)
+    return teleop
+
+
+def get_teleop():
+    return teleop if teleop is not None else init_teleop()
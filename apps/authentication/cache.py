@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+
+import time
+import threading
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+
+class CachedUser(UserMixin):
+    """Copia ligera de un usuario para Flask-Login (sin contraseña ni sesión de BD)"""
+
+    def __init__(self, id, username, email=None, oauth_github=None, api_token_version=0):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.oauth_github = oauth_github
+        self.api_token_version = api_token_version
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.username, user.email, user.oauth_github,
+                   user.api_token_version or 0)
+
+    def __repr__(self):
+        return str(self.username)
+
+
+class UserCache:
+    """Caché LRU con caducidad de usuarios cargados, por id
+
+    Evita una consulta a la base de datos por cada petición autenticada; se
+    invalida al cerrar sesión y cuando el usuario se modifica o se borra.
+    """
+
+    def __init__(self, size=1024, ttl=60.0):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (CachedUser, caduca_en)
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, size=None, ttl=None):
+        if size is not None:
+            self.size = size
+        if ttl is not None:
+            self.ttl = ttl
+        self.clear()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        if self.size <= 0 or self.ttl <= 0:
+            return  # Caché desactivada
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'capacity': self.size, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache()
@@ -1,14 +1,17 @@
 # -*- encoding: utf-8 -*-
 
 
-from flask_login import UserMixin
+from flask import current_app
+from flask_login import UserMixin, user_logged_out
 
+from sqlalchemy import event, inspect, text
 from sqlalchemy.orm import relationship
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 
 from apps import db, login_manager
 
 from apps.authentication.util import hash_pass
+from apps.authentication.cache import CachedUser, user_cache
 
 class Users(db.Model, UserMixin):
 
@@ -21,6 +24,9 @@ class Users(db.Model, UserMixin):
 
     oauth_github  = db.Column(db.String(100), nullable=True)
 
+    # Se incrementa para revocar todos los tokens de API emitidos al usuario
+    api_token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     def __init__(self, **kwargs):
         for property, value in kwargs.items():
             # depending on whether value is an iterable or not, we must
@@ -39,16 +45,85 @@ class Users(db.Model, UserMixin):
         return str(self.username)
 
 
-@login_manager.user_loader
-def user_loader(id):
-    return Users.query.filter_by(id=id).first()
+def cached_user(user_id):
+    """CachedUser desde la caché, o desde la BD si no está; None si no existe"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = Users.query.filter_by(id=user_id).first()
+    if user is None:
+        return None
+    cached = CachedUser.from_model(user)
+    user_cache.put(cached)
+    return cached
 
 
-@login_manager.request_loader
-def request_loader(request):
-    username = request.form.get('username')
-    user = Users.query.filter_by(username=username).first()
-    return user if user else None
+@login_manager.user_loader
+def user_loader(id):
+    # Cada petición autenticada pasa por aquí: servir desde la caché
+    try:
+        user_id = int(id)
+    except (TypeError, ValueError):
+        return None
+    return cached_user(user_id)
+
+
+def load_token_user(user_id, version):
+    """Usuario de un token de API si sigue existiendo y no se revocaron sus
+    tokens (la versión coincide); normalmente sale de la caché, sin BD"""
+    user = cached_user(user_id)
+    if user is None or user.api_token_version != version:
+        return None
+    return user
+
+
+def revoke_api_tokens(user_id):
+    """Invalida todos los tokens de API emitidos al usuario"""
+    user = Users.query.filter_by(id=user_id).first()
+    if user is None:
+        return False
+    user.api_token_version = (user.api_token_version or 0) + 1
+    db.session.commit()  # after_update invalida la caché
+    return True
+
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+@user_logged_out.connect
+def forget_logged_out_user(sender, user):
+    if user is not None and getattr(user, 'id', None) is not None:
+        if current_app.config.get('API_TOKEN_REVOKE_ON_LOGOUT', True):
+            revoke_api_tokens(user.id)
+        user_cache.invalidate(user.id)
+
+
+def load_db_user(user):
+    """Instancia ORM de un usuario de sesión (CachedUser), para lo que necesita
+    relaciones de SQLAlchemy; None si no hay sesión"""
+    if user is None or not user.is_authenticated:
+        return None
+    if isinstance(user, Users):
+        return user
+    return Users.query.filter_by(id=user.id).first()
+
+
+def add_missing_user_columns():
+    """Añade api_token_version a una tabla Users creada antes de que existiera
+
+    create_all() no altera tablas existentes y el proyecto no guarda
+    migraciones, así que sin esto toda consulta de Users fallaría.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns(Users.__tablename__)}
+    if 'api_token_version' in columns:
+        return
+    table = db.engine.dialect.identifier_preparer.quote(Users.__tablename__)
+    with db.engine.begin() as connection:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN api_token_version '
+                                f'INTEGER NOT NULL DEFAULT 0'))
 
 class OAuth(OAuthConsumerMixin, db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("Users.id", ondelete="cascade"), nullable=False)
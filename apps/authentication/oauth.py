@@ -10,7 +10,7 @@ from flask_dance.consumer.storage.sqla import SQLAlchemyStorage
 from flask_dance.contrib.twitter import twitter, make_twitter_blueprint
 from sqlalchemy.orm.exc import NoResultFound
 from apps.config import Config
-from .models import Users, db, OAuth
+from .models import Users, db, OAuth, load_db_user
 from flask import redirect, url_for
 from flask import flash
 
@@ -21,7 +21,8 @@ github_blueprint = make_github_blueprint(
     storage=SQLAlchemyStorage(
         OAuth,
         db.session,
-        user=current_user,
+        # current_user es un CachedUser; el token se asocia al usuario ORM
+        user=lambda: load_db_user(current_user),
         user_required=False,        
     ),   
 )
@@ -13,7 +13,7 @@ from apps import db, login_manager
 from apps.authentication import blueprint
 from apps.authentication.forms import LoginForm, CreateAccountForm
 from apps.authentication.models import Users
-from apps.authentication.util import verify_pass
+from apps.authentication.util import verify_pass, hash_pass, needs_rehash, HashingBusy
 
 
 @blueprint.route('/')
@@ -43,8 +43,24 @@ def login():
         # Locate user
         user = Users.query.filter_by(username=username).first()
 
-        # Check the password
-        if user and verify_pass(password, user.password):
+        # Check the password (PBKDF2 runs in the bounded hashing pool)
+        try:
+            valid = bool(user) and verify_pass(password, user.password)
+        except HashingBusy:
+            return render_template('accounts/login.html',
+                                   msg='Too many logins in progress, please try again',
+                                   form=login_form)
+
+        if valid and needs_rehash(user.password):
+            # Upgrade old-format or old-cost hashes transparently; if the pool
+            # is full, skip it and let the next login retry
+            try:
+                user.password = hash_pass(password)
+                db.session.commit()
+            except HashingBusy:
+                pass
+
+        if valid:
 
             login_user(user)
             return redirect(url_for('authentication_blueprint.route_default'))
@@ -85,7 +101,13 @@ def register():
                                    form=create_account_form)
 
         # else we can create the user
-        user = Users(**request.form)
+        try:
+            user = Users(**request.form)
+        except HashingBusy:
+            return render_template('accounts/register.html',
+                                   msg='Server busy, please try again',
+                                   success=False,
+                                   form=create_account_form)
         db.session.add(user)
         db.session.commit()
 
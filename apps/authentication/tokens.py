@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TokenVerifier:
+    """Tokens de API firmados con HMAC: "<user_id>.<versión>.<caduca>.<firma>"
+
+    La verificación no toca la base de datos: basta con recalcular la firma
+    con el secreto. Los tokens válidos se recuerdan un rato para no repetir
+    ni eso en cada petición (los inválidos no se guardan). Todos caducan;
+    la versión se compara con la del usuario (ver load_token_user) para
+    revocar los de un usuario, y cambiar el secreto revoca todos.
+    """
+
+    def __init__(self, secret='', cache_size=1024, cache_ttl=300.0):
+        self._secret = secret.encode('utf-8')
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # token -> (user_id, versión, recordar_hasta)
+
+    def configure(self, secret=None, cache_size=None, cache_ttl=None):
+        if secret is not None:
+            self._secret = secret.encode('utf-8')
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+        with self._lock:
+            self._cache.clear()
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload.encode('ascii'), hashlib.sha256).hexdigest()
+
+    def issue(self, user_id, version, ttl):
+        """Token para user_id con su versión de tokens actual; ttl en segundos (> 0)"""
+        if ttl <= 0:
+            raise ValueError("Los tokens de API deben caducar (ttl > 0)")
+        payload = f'{int(user_id)}.{int(version)}.{int(time.time() + ttl)}'
+        return f'{payload}.{self._sign(payload)}'
+
+    def verify(self, token):
+        """(user_id, versión) del token, o None si la firma no cuadra o caducó"""
+        if not token or not self._secret:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is not None and entry[2] > now:
+                self._cache.move_to_end(token)
+                return entry[0], entry[1]
+
+        try:
+            user_id, version, expires, signature = token.split('.')
+            user_id, version, expires = int(user_id), int(version), int(expires)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(self._sign(f'{user_id}.{version}.{expires}'), signature):
+            return None
+        if expires <= now:
+            return None
+
+        with self._lock:
+            self._cache[token] = (user_id, version, min(now + self.cache_ttl, expires))
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user_id, version
+
+
+api_tokens = TokenVerifier()
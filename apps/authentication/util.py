@@ -2,31 +2,147 @@
 
 
 import os
+import hmac
+import time
 import hashlib
 import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Inspiration -> https://www.vitoshacademy.com/hashing-passwords-in-python/
 
+# Formato versionado: $pbkdf2-sha512$<iteraciones>$<salt>$<hash hex>
+# Los hashes antiguos (salt de 64 + hash de 128 caracteres hex, 100000
+# iteraciones) se siguen aceptando y se actualizan al iniciar sesión.
+HASH_PREFIX = '$pbkdf2-sha512$'
+LEGACY_ITERATIONS = 100000
+
+
+class HashingBusy(Exception):
+    """Hay demasiados hashes de contraseña en curso; reintentar más tarde"""
+
+
+class _HashPool:
+    """PBKDF2 en un pool acotado, con un límite de trabajos
+
+    La petición sigue esperando el resultado en su hilo; el pool limita
+    cuántos hashes se calculan a la vez (pbkdf2_hmac suelta el GIL) y el
+    tope max_pending, que debe quedar por debajo de los hilos del servidor,
+    cuántos hilos pueden quedarse esperando. Si ya hay max_pending trabajos
+    (en curso + en cola) se rechaza en vez de encolar.
+    """
+
+    def __init__(self, iterations=LEGACY_ITERATIONS, workers=2, max_pending=2):
+        self.iterations = iterations
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._metrics = {
+            'hashed': 0,
+            'rejected': 0,
+            'queue_last_ms': 0.0,
+            'queue_avg_ms': 0.0,
+            'queue_max_ms': 0.0,
+            'hash_avg_ms': 0.0,
+        }
+
+    def configure(self, iterations=None, workers=None, max_pending=None):
+        if iterations is not None:
+            self.iterations = iterations
+        if workers is not None and workers != self.workers:
+            self.workers = workers
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        if max_pending is not None and max_pending != self.max_pending:
+            self.max_pending = max_pending
+            self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _record(self, queued_ms, hash_ms):
+        with self._lock:
+            metrics = self._metrics
+            metrics['hashed'] += 1
+            count = metrics['hashed']
+            metrics['queue_last_ms'] = queued_ms
+            metrics['queue_avg_ms'] += (queued_ms - metrics['queue_avg_ms']) / count
+            metrics['queue_max_ms'] = max(metrics['queue_max_ms'], queued_ms)
+            metrics['hash_avg_ms'] += (hash_ms - metrics['hash_avg_ms']) / count
+
+    def pbkdf2(self, password, salt, iterations):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics['rejected'] += 1
+            raise HashingBusy("Demasiados inicios de sesión en curso")
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='pbkdf2')
+                executor = self._executor
+            submitted = time.perf_counter()
+
+            def work():
+                started = time.perf_counter()
+                digest = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'), salt, iterations)
+                self._record((started - submitted) * 1000, (time.perf_counter() - started) * 1000)
+                return digest
+
+            return executor.submit(work).result()
+        finally:
+            slots.release()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update(iterations=self.iterations, workers=self.workers, max_pending=self.max_pending)
+        return metrics
+
+
+_pool = _HashPool()
+
+
+def configure_hashing(iterations=None, workers=None, max_pending=None):
+    """Coste de PBKDF2 para hashes nuevos y tamaño del pool (desde app.config)"""
+    _pool.configure(iterations, workers, max_pending)
+
+
+def hashing_stats():
+    return _pool.stats()
+
 
 def hash_pass(password):
     """Hash a password for storing."""
 
-    salt = hashlib.sha256(os.urandom(60)).hexdigest().encode('ascii')
-    pwdhash = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'),
-                                  salt, 100000)
-    pwdhash = binascii.hexlify(pwdhash)
-    return (salt + pwdhash)  # return bytes
+    salt = hashlib.sha256(os.urandom(60)).hexdigest()
+    iterations = _pool.iterations
+    pwdhash = binascii.hexlify(_pool.pbkdf2(password, salt.encode('ascii'), iterations))
+    return f'{HASH_PREFIX}{iterations}${salt}$'.encode('ascii') + pwdhash  # return bytes
+
+
+def _parse_hash(stored_password):
+    """(iteraciones, salt, hash hex) de un hash versionado o antiguo"""
+    stored_password = stored_password.decode('ascii')
+    if stored_password.startswith(HASH_PREFIX):
+        iterations, salt, pwdhash = stored_password[len(HASH_PREFIX):].split('$')
+        return int(iterations), salt, pwdhash
+    return LEGACY_ITERATIONS, stored_password[:64], stored_password[64:]
 
 
 def verify_pass(provided_password, stored_password):
     """Verify a stored password against one provided by user"""
 
-    stored_password = stored_password.decode('ascii')
-    salt = stored_password[:64]
-    stored_password = stored_password[64:]
-    pwdhash = hashlib.pbkdf2_hmac('sha512',
-                                  provided_password.encode('utf-8'),
-                                  salt.encode('ascii'),
-                                  100000)
-    pwdhash = binascii.hexlify(pwdhash).decode('ascii')
-    return pwdhash == stored_password
+    iterations, salt, stored_hash = _parse_hash(stored_password)
+    pwdhash = binascii.hexlify(_pool.pbkdf2(provided_password, salt.encode('ascii'), iterations))
+    return hmac.compare_digest(pwdhash.decode('ascii'), stored_hash)
+
+
+def needs_rehash(stored_password):
+    """True si el hash es del formato antiguo o usa otro número de iteraciones"""
+
+    stored = stored_password.decode('ascii')
+    if not stored.startswith(HASH_PREFIX):
+        return True
+    return _parse_hash(stored_password)[0] != _pool.iterations
@@ -25,8 +25,109 @@ class Config(object):
     if GITHUB_ID and GITHUB_SECRET:
          SOCIAL_AUTH_GITHUB  = True
     
+    # Caché de usuarios de Flask-Login: entradas y segundos de validez (0 = desactivada)
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+
+    # Tokens de la API /api/arduino: secreto HMAC (cambiarlo revoca todos), validez máxima
+    # (y por defecto) de los emitidos en segundos (> 0: todos caducan) y cuánto se recuerda
+    # uno ya verificado. Cerrar sesión revoca los tokens del usuario salvo que se desactive
+    API_TOKEN_SECRET = os.getenv('API_TOKEN_SECRET', SECRET_KEY)
+    API_TOKEN_TTL = max(int(os.getenv('API_TOKEN_TTL', str(30 * 24 * 3600))), 1)
+    API_TOKEN_CACHE_TTL = float(os.getenv('API_TOKEN_CACHE_TTL', '300'))
+    API_TOKEN_REVOKE_ON_LOGOUT = os.getenv('API_TOKEN_REVOKE_ON_LOGOUT', 'True') == 'True'
+
+    # Hilos de gunicorn (GUNICORN_THREADS, ver gunicorn-cfg.py); de ellos salen los topes siguientes
+    SERVER_THREADS = int(os.getenv('GUNICORN_THREADS', '12'))
+    # Máximo de streams abiertos a la vez (feeds de video y landmarks, /arduino/events);
+    # por encima se responde 503. Cada uno ocupa un hilo, así que por defecto se
+    # dejan 4 para login y servos (0 = sin límite)
+    MAX_STREAMS = int(os.getenv('MAX_STREAMS', str(max(SERVER_THREADS - 4, 1))))
+
+    # Hash de contraseñas (PBKDF2-SHA512): iteraciones para hashes nuevos (los viejos se
+    # actualizan al iniciar sesión), hilos del pool y trabajos máximos antes de rechazar.
+    # Cada login espera su hash en su propio hilo de gunicorn (el pool solo limita cuántos
+    # se calculan a la vez), así que el tope por defecto es la mitad de los hilos que no
+    # usan los streams: un aluvión de logins nunca deja sin hilos al control de servos
+    PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', '100000'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING',
+                                              str(max((SERVER_THREADS - MAX_STREAMS) // 2, 1))))
+
+    # OpenCV y MediaPipe se importan con el primer feed; True para cargarlos
+    # en segundo plano al arrancar y que el primer cliente no espere
+    VIDEO_PRELOAD = os.getenv('VIDEO_PRELOAD', 'False') == 'True'
+    # Inferencia de pose: 'inline' (en el hilo de la cámara) o 'process' (un proceso por cámara)
+    VIDEO_INFERENCE_BACKEND = os.getenv('VIDEO_INFERENCE_BACKEND', 'inline')
+    # Ajustes de pose por defecto para todas las cámaras
+    # Escala del frame que se pasa a MediaPipe (0.5 = mitad de ancho y alto); el video se sirve a tamaño completo
+    VIDEO_INFERENCE_SCALE = float(os.getenv('VIDEO_INFERENCE_SCALE', '1.0'))
+    # Inferir cada N frames y dibujar los últimos landmarks en los intermedios
+    VIDEO_POSE_STRIDE = int(os.getenv('VIDEO_POSE_STRIDE', '1'))
+    VIDEO_MODEL_COMPLEXITY = int(os.getenv('VIDEO_MODEL_COMPLEXITY', '1'))
+    VIDEO_SMOOTH_LANDMARKS = os.getenv('VIDEO_SMOOTH_LANDMARKS', 'True') == 'True'
+    VIDEO_MIN_DETECTION_CONFIDENCE = float(os.getenv('VIDEO_MIN_DETECTION_CONFIDENCE', '0.5'))
+    VIDEO_MIN_TRACKING_CONFIDENCE = float(os.getenv('VIDEO_MIN_TRACKING_CONFIDENCE', '0.5'))
+    # Ajustes por cámara que pisan los anteriores, p.ej. "0:scale=0.5,stride=2;1:model_complexity=0"
+    VIDEO_CAMERA_SETTINGS = os.getenv('VIDEO_CAMERA_SETTINGS', '')
+    # Salida MJPEG: calidad JPEG (1-100) y escala de la imagen servida
+    VIDEO_JPEG_QUALITY = int(os.getenv('VIDEO_JPEG_QUALITY', '80'))
+    VIDEO_OUTPUT_SCALE = float(os.getenv('VIDEO_OUTPUT_SCALE', '1.0'))
+    # Codificador: 'auto' (libjpeg-turbo vía PyTurboJPEG si está instalado), 'turbojpeg' u 'opencv'
+    VIDEO_JPEG_ENCODER = os.getenv('VIDEO_JPEG_ENCODER', 'auto')
+    # Modo adaptativo: baja calidad y luego tamaño si codificar supera el presupuesto (ms)
+    # o los clientes descartan frames; los recupera cuando hay margen
+    VIDEO_ADAPTIVE_JPEG = os.getenv('VIDEO_ADAPTIVE_JPEG', 'False') == 'True'
+    VIDEO_ENCODE_BUDGET_MS = float(os.getenv('VIDEO_ENCODE_BUDGET_MS', '15'))
+    VIDEO_MIN_JPEG_QUALITY = int(os.getenv('VIDEO_MIN_JPEG_QUALITY', '40'))
+    VIDEO_MIN_OUTPUT_SCALE = float(os.getenv('VIDEO_MIN_OUTPUT_SCALE', '0.5'))
+
     ARDUINO_PORT = os.getenv('ARDUINO_PORT', 'COM12')
     ARDUINO_BAUD_RATE = int(os.getenv('ARDUINO_BAUD_RATE', '9600'))
+    # Velocidades a negociar tras conectar (la más rápida que acepte el firmware); vacío = no negociar
+    ARDUINO_BAUD_CANDIDATES = [int(rate) for rate in os.getenv(
+        'ARDUINO_BAUD_CANDIDATES', '115200,250000,500000,1000000').split(',') if rate.strip()]
+
+    # Segundos que se reutiliza la lista de puertos serie (se refresca antes si cambia /dev/serial/by-id)
+    ARDUINO_PORTS_TTL = float(os.getenv('ARDUINO_PORTS_TTL', '5'))
+    # Invalidar la lista con eventos de udev si pyudev está instalado
+    ARDUINO_PORTS_WATCH = os.getenv('ARDUINO_PORTS_WATCH', 'True') == 'True'
+
+    # Reintentos de conexión en segundo plano: espera inicial y máxima (s), con backoff exponencial
+    ARDUINO_RECONNECT_MIN = float(os.getenv('ARDUINO_RECONNECT_MIN', '0.5'))
+    ARDUINO_RECONNECT_MAX = float(os.getenv('ARDUINO_RECONNECT_MAX', '30'))
+
+    # Posición "home" por servo para el reset, p.ej. "2:90,3:45" (el resto va a 90°)
+    ARDUINO_HOME_ANGLES = os.getenv('ARDUINO_HOME_ANGLES', '')
+    # Reset escalonado: servos por grupo (0 = todos en una sola escritura) y pausa entre grupos
+    ARDUINO_RESET_GROUP_SIZE = int(os.getenv('ARDUINO_RESET_GROUP_SIZE', '0'))
+    ARDUINO_RESET_INTERVAL = float(os.getenv('ARDUINO_RESET_INTERVAL', '0.1'))
+    # Ventana (s) en la que solo se conserva el último ángulo pedido por servo (0 = desactivado)
+    ARDUINO_COALESCE_WINDOW = float(os.getenv('ARDUINO_COALESCE_WINDOW', '0.02'))
+    # Formato de trama: 'ascii' ("pin,ángulo\n") o 'binary' (se negocia al conectar)
+    ARDUINO_PROTOCOL = os.getenv('ARDUINO_PROTOCOL', 'ascii')
+    # Intervalo mínimo (s) entre envíos de /arduino/events a cada navegador; los cambios intermedios se agrupan
+    ARDUINO_EVENTS_INTERVAL = float(os.getenv('ARDUINO_EVENTS_INTERVAL', '0.1'))
+    # Movimientos suaves (/arduino/move): frecuencia de puntos (Hz), perfil ('linear', 'ease', 'min_jerk')
+    # y velocidad máxima por defecto (grados/s)
+    ARDUINO_MOTION_TICK_HZ = float(os.getenv('ARDUINO_MOTION_TICK_HZ', '50'))
+    ARDUINO_MOTION_PROFILE = os.getenv('ARDUINO_MOTION_PROFILE', 'min_jerk')
+    ARDUINO_MOTION_MAX_VELOCITY = float(os.getenv('ARDUINO_MOTION_MAX_VELOCITY', '180'))
+
+    # Teleoperación: cámara cuyos landmarks mueven los servos y frecuencia de envío (Hz)
+    TELEOP_CAMERA = int(os.getenv('TELEOP_CAMERA', '0'))
+    TELEOP_RATE_HZ = float(os.getenv('TELEOP_RATE_HZ', '30'))
+    # Grados mínimos de cambio para reenviar un servo
+    TELEOP_DEADBAND = int(os.getenv('TELEOP_DEADBAND', '1'))
+    # Filtro de ángulos: 'one_euro', 'ema' o 'none'
+    TELEOP_FILTER = os.getenv('TELEOP_FILTER', 'one_euro')
+    TELEOP_MIN_CUTOFF = float(os.getenv('TELEOP_MIN_CUTOFF', '1.0'))
+    TELEOP_BETA = float(os.getenv('TELEOP_BETA', '0.02'))
+    TELEOP_EMA_ALPHA = float(os.getenv('TELEOP_EMA_ALPHA', '0.5'))
+    # Visibilidad mínima de los tres landmarks para mover una articulación
+    TELEOP_MIN_VISIBILITY = float(os.getenv('TELEOP_MIN_VISIBILITY', '0.5'))
+    # Articulaciones "pin:a-b-c[:min-max]" separadas por ';' (vacío = mapeo por defecto de teleop.py)
+    TELEOP_JOINTS = os.getenv('TELEOP_JOINTS', '')
 
 class ProductionConfig(Config):
     DEBUG = False
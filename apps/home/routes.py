@@ -1,7 +1,7 @@
 # -*- encoding: utf-8 -*-"""
 
 from apps.home import blueprint
-from flask import render_template, request
+from flask import render_template, request, current_app
 from flask_login import login_required
 from jinja2 import TemplateNotFound
 import serial
@@ -83,10 +83,12 @@ def get_segment(request):
 def debug_info():
     """Debug information endpoint"""
     try:
-        from apps.arduino.controller import arduino_controller, init_arduino
+        from apps.arduino.controller import get_arduino
+        from apps.authentication.util import hashing_stats
+        from apps.startup import startup_report
+        from apps.streams import stream_slots
         
-        if arduino_controller is None:
-            init_arduino()
+        arduino_controller = get_arduino()
             
         if arduino_controller is None:
             return jsonify({
@@ -94,20 +96,22 @@ def debug_info():
                 'message': 'No se pudo inicializar el controlador de Arduino'
             })
             
-        # Get connection status
-        is_connected = arduino_controller.is_connected()
-        
-        # Try to connect if not connected
-        if not is_connected:
-            connect_result = arduino_controller.connect()
-            is_connected = connect_result
+        # Served from the controller's cached status snapshot
+        state = arduino_controller.get_status()
+        is_connected = state['connected']
+        # Solo lectura: los reintentos son cosa del supervisor (con su backoff)
             
         return jsonify({
             'status': 'success' if is_connected else 'error',
-            'message': 'Arduino conectado' if is_connected else 'No se pudo conectar al Arduino',
-            'port': arduino_controller.port,
-            'baud_rate': arduino_controller.baud_rate,
-            'available_ports': arduino_controller.get_available_ports()
+            'message': 'Arduino conectado' if is_connected else 'Arduino no conectado, el supervisor reintenta en segundo plano',
+            'port': state['port'],
+            'baud_rate': state['baud_rate'],
+            'last_ack': state['last_ack'],
+            'last_error': state['last_error'],
+            'available_ports': arduino_controller.get_available_ports(),
+            'password_hashing': hashing_stats(),
+            'startup': startup_report.entries(),
+            'streams': stream_slots.stats(current_app.config.get('MAX_STREAMS', 0))
         })
         
     except Exception as e:
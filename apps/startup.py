@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StartupReport:
+    """Tiempos de importación e inicialización por subsistema
+
+    Se registran al arrancar (y las cargas diferidas cuando ocurren) para
+    detectar regresiones en el tiempo de arranque; ver /debug_info.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self.started_at = time.time()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._entries.append({'subsystem': name, 'ms': round(seconds * 1000, 1),
+                                  'at': round(time.time() - self.started_at, 3)})
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def summary(self):
+        return 'Arranque: ' + ', '.join(f"{entry['subsystem']} {entry['ms']} ms" for entry in self.entries())
+
+
+startup_report = StartupReport()
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+import threading
+
+from flask import Response, current_app, request
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSlots:
+    """Cuenta los streams abiertos y rechaza los que pasan del máximo
+
+    Cada stream (feeds de video y landmarks, /arduino/events) ocupa un hilo
+    del servidor mientras el cliente siga conectado; con un tope por debajo
+    de los hilos disponibles siempre quedan libres para las peticiones
+    cortas (login, servos). max_streams <= 0 = sin límite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self, max_streams):
+        with self._lock:
+            if 0 < max_streams <= self.active:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def stats(self, max_streams):
+        with self._lock:
+            return {'active': self.active, 'max': max_streams, 'rejected': self.rejected}
+
+
+stream_slots = StreamSlots()
+
+
+def stream_response(body, **kwargs):
+    """Response para un stream largo, o 503 si ya se alcanzó MAX_STREAMS
+
+    body es una función que devuelve el generador; solo se llama si hay hueco.
+    """
+    max_streams = current_app.config.get('MAX_STREAMS', 0)
+    if not stream_slots.acquire(max_streams):
+        logger.warning(f"Stream rechazado para {request.remote_addr}: {max_streams} streams abiertos")
+        return Response('Demasiados streams abiertos, reintenta más tarde', status=503,
+                        mimetype='text/plain', headers={'Retry-After': '5'})
+    try:
+        response = Response(body(), **kwargs)
+    except Exception:
+        stream_slots.release()
+        raise
+    # Se llama al cerrar la respuesta, también si el cliente se desconecta
+    response.call_on_close(stream_slots.release)
+    return response
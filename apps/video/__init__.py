@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+
+"""Subsistema de video. OpenCV y MediaPipe pesan cientos de MB y tardan
+segundos en importarse, así que video_processing solo se carga la primera
+vez que se pide un feed (o al arrancar si VIDEO_PRELOAD=True)."""
+
+import logging
+import threading
+
+from flask import Blueprint
+
+from apps.startup import startup_report
+
+# Feeds MJPEG y de landmarks: respuestas largas, con su propio límite de
+# conexiones para que no se coman los hilos de login y control de servos
+blueprint = Blueprint(
+    'video_blueprint',
+    __name__,
+    url_prefix=''
+)
+
+logger = logging.getLogger(__name__)
+
+_module = None
+_lock = threading.Lock()
+_config = {}
+
+
+def init_app(app):
+    """Guarda la configuración para cuando se cargue el módulo"""
+    global _config
+    _config = app.config
+    if app.config.get('VIDEO_PRELOAD', False):
+        threading.Thread(target=get_video, name='video-preload', daemon=True).start()
+
+
+def get_video():
+    """Módulo video_processing ya configurado (lo importa la primera vez)"""
+    global _module
+    if _module is None:
+        with _lock:
+            if _module is None:
+                with startup_report.timed('video: cv2 + mediapipe (diferido)'):
+                    import video_processing
+                    video_processing.configure(_config)
+                logger.info("Subsistema de video cargado")
+                _module = video_processing
+    return _module
+
+
+def is_loaded():
+    return _module is not None
@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+
+from flask import jsonify, request
+from flask_login import login_required
+
+from apps.streams import stream_response
+from apps.video import blueprint, get_video, is_loaded
+
+
+def video_response(camera_id):
+    return stream_response(lambda: get_video().gen_video_feed(camera_id, request.remote_addr),
+                           mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@blueprint.route('/video_feed_0')
+def video_feed_0():
+    return video_response(1) # si, asi aparecen en orden
+
+
+@blueprint.route('/video_feed_1')
+def video_feed_1():
+    return video_response(0) # si, asi aparecen en orden
+
+
+def landmark_response(camera_id):
+    # Datos corporales de quien está frente a la cámara: solo con sesión iniciada
+    # ?format=ndjson para JSON por líneas; por defecto Server-Sent Events
+    fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'sse'
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/event-stream'
+    return stream_response(lambda: get_video().gen_landmark_feed(camera_id, request.remote_addr, fmt),
+                           mimetype=mimetype,
+                           headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@blueprint.route('/landmarks_feed_0')
+@login_required
+def landmarks_feed_0():
+    return landmark_response(1) # mismo orden que video_feed_0
+
+
+@blueprint.route('/landmarks_feed_1')
+@login_required
+def landmarks_feed_1():
+    return landmark_response(0)
+
+
+@blueprint.route('/video_feed_stats')
+@login_required
+def video_feed_stats():
+    # Frames descartados por cliente lento, para ajustar ancho de banda
+    # (sin cargar el video si aún nadie pidió un feed)
+    return jsonify(get_video().get_stream_stats() if is_loaded() else [])
@@ -3,8 +3,22 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-bind = '0.0.0.0:5005'
-workers = 1
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5005')
+# Un único proceso: el puerto serie del Arduino y las cámaras no se pueden
+# abrir desde varios a la vez
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+# Los feeds de video son respuestas que no terminan; con 'gthread' cada uno
+# ocupa un hilo y el resto sigue atendiendo login y servos (ver MAX_STREAMS).
+# No usar gevent/eventlet: cámaras (cap.read, pose.process, imencode), el
+# hilo del puerto serie y el pool de PBKDF2 hacen llamadas nativas
+# bloqueantes que, convertidos en greenlets, pararían todas las peticiones
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '12'))
+# Con gthread un stream largo no bloquea el latido del worker, así que el
+# timeout por defecto sirve; con 'sync' cada feed lo agotaría
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
 accesslog = '-'
 loglevel = 'debug'
 capture_output = True
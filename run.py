@@ -1,16 +1,19 @@
 # -*- encoding: utf-8 -*-
 
 import os
+import time
+_started = time.perf_counter()
+
 from flask_migrate import Migrate
 from flask_minify import Minify
 from sys import exit
-from flask import Response
 
 from apps.config import config_dict
 from apps import create_app, db
+from apps.startup import startup_report
 
-# Importamos las funciones desde el archivo video_processing.py
-from video_processing import gen_video_feed
+# Los feeds de video viven en apps/video; OpenCV y MediaPipe se importan con el primer feed
+startup_report.record('imports (flask, sqlalchemy, apps)', time.perf_counter() - _started)
 
 # WARNING: Don't run with debug turned on in production!
 DEBUG = (os.getenv('DEBUG', 'False') == 'True')
@@ -24,26 +27,28 @@ try:
 except KeyError:
     exit('Error: Invalid <config_mode>. Expected values [Debug, Production] ')
 
-app = create_app(app_config)
-Migrate(app, db)
 
-if not DEBUG:
-    Minify(app=app, html=True, js=False, cssless=False)
+def build_app(app_config):
+    with startup_report.timed('create_app'):
+        app = create_app(app_config)
+    Migrate(app, db)
+
+    if not DEBUG:
+        Minify(app=app, html=True, js=False, cssless=False)
+
+    if DEBUG:
+        app.logger.info('DEBUG       = ' + str(DEBUG))
+        app.logger.info('DBMS        = ' + app_config.SQLALCHEMY_DATABASE_URI)
+        app.logger.info('ASSETS_ROOT = ' + app_config.ASSETS_ROOT)
 
-if DEBUG:
-    app.logger.info('DEBUG       = ' + str(DEBUG))
-    app.logger.info('DBMS        = ' + app_config.SQLALCHEMY_DATABASE_URI)
-    app.logger.info('ASSETS_ROOT = ' + app_config.ASSETS_ROOT)
+    startup_report.record('total', time.perf_counter() - _started)
+    app.logger.info(startup_report.summary())
+    return app
 
-@app.route('/video_feed_0')
-def video_feed_0():
-    return Response(gen_video_feed(1), # si, asi aparecen en orden
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/video_feed_1')
-def video_feed_1():
-    return Response(gen_video_feed(0), # si, asi aparecen en orden
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+# Los procesos de inferencia de pose (forkserver/spawn) reimportan este script
+# como __mp_main__: ahí no se crea otra app ni se abre el puerto serie
+app = build_app(app_config) if __name__ != '__mp_main__' else None
 
 if __name__ == "__main__":
     app.run()
@@ -1,43 +1,759 @@
+import time
+import json
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
 import cv2
+import numpy as np
 import mediapipe as mp
 
+logger = logging.getLogger(__name__)
+
 # Inicializamos MediaPipe para la estimación de pose
 mp_pose = mp.solutions.pose
 mp_drawing = mp.solutions.drawing_utils
 
-def process_frame(frame, pose):
-    frame = cv2.flip(frame, 1)
-    """Procesa cada frame usando MediaPipe para la estimación de pose."""
+# Ajustes tomados de la configuración de la app (ver configure)
+_settings = {
+    'backend': 'inline',
+    'scale': 1.0,
+    'stride': 1,
+    'model_complexity': 1,
+    'smooth_landmarks': True,
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5,
+    'jpeg_quality': 80,
+    'output_scale': 1.0,
+    'encoder': 'auto',
+    'adaptive': False,
+    'encode_budget_ms': 15.0,
+    'min_jpeg_quality': 40,
+    'min_output_scale': 0.5,
+}
+# Ajustes que pisan a _settings para una cámara concreta: {camera_id: {...}}
+_camera_settings = {}
+
+# Ajustes que acepta mp_pose.Pose
+POSE_OPTIONS = ('model_complexity', 'smooth_landmarks',
+                'min_detection_confidence', 'min_tracking_confidence')
+
+
+def _parse_value(key, value):
+    default = _settings[key]
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return type(default)(value)
+
+
+def parse_camera_settings(value):
+    """ "0:scale=0.5,stride=2;1:model_complexity=0" -> {0: {...}, 1: {...}} """
+    cameras = {}
+    for entry in filter(None, (part.strip() for part in value.split(';'))):
+        camera_id, _, options = entry.partition(':')
+        overrides = cameras.setdefault(int(camera_id), {})
+        for option in filter(None, (part.strip() for part in options.split(','))):
+            key, _, raw = option.partition('=')
+            key = key.strip()
+            if key not in _settings or key == 'backend':
+                raise ValueError(f"Ajuste de cámara desconocido: {key}")
+            overrides[key] = _parse_value(key, raw)
+    return cameras
+
+
+def configure(config):
+    """Carga los ajustes de video desde app.config"""
+    _settings['backend'] = config.get('VIDEO_INFERENCE_BACKEND', 'inline')
+    _settings['scale'] = float(config.get('VIDEO_INFERENCE_SCALE', 1.0))
+    _settings['stride'] = int(config.get('VIDEO_POSE_STRIDE', 1))
+    _settings['model_complexity'] = int(config.get('VIDEO_MODEL_COMPLEXITY', 1))
+    _settings['smooth_landmarks'] = bool(config.get('VIDEO_SMOOTH_LANDMARKS', True))
+    _settings['min_detection_confidence'] = float(config.get('VIDEO_MIN_DETECTION_CONFIDENCE', 0.5))
+    _settings['min_tracking_confidence'] = float(config.get('VIDEO_MIN_TRACKING_CONFIDENCE', 0.5))
+    _settings['jpeg_quality'] = int(config.get('VIDEO_JPEG_QUALITY', 80))
+    _settings['output_scale'] = float(config.get('VIDEO_OUTPUT_SCALE', 1.0))
+    _settings['encoder'] = config.get('VIDEO_JPEG_ENCODER', 'auto')
+    _settings['adaptive'] = bool(config.get('VIDEO_ADAPTIVE_JPEG', False))
+    _settings['encode_budget_ms'] = float(config.get('VIDEO_ENCODE_BUDGET_MS', 15.0))
+    _settings['min_jpeg_quality'] = int(config.get('VIDEO_MIN_JPEG_QUALITY', 40))
+    _settings['min_output_scale'] = float(config.get('VIDEO_MIN_OUTPUT_SCALE', 0.5))
+    try:
+        cameras = parse_camera_settings(config.get('VIDEO_CAMERA_SETTINGS', ''))
+    except ValueError as e:
+        logger.error(f"VIDEO_CAMERA_SETTINGS inválido, se ignora: {str(e)}")
+        cameras = {}
+    _camera_settings.clear()
+    _camera_settings.update(cameras)
+
+
+def camera_settings(camera_id):
+    """Ajustes efectivos de una cámara (los generales más los suyos)"""
+    settings = dict(_settings)
+    settings.update(_camera_settings.get(camera_id, {}))
+    settings['scale'] = min(max(settings['scale'], 0.05), 1.0)
+    settings['stride'] = max(settings['stride'], 1)
+    settings['jpeg_quality'] = min(max(settings['jpeg_quality'], 1), 100)
+    settings['output_scale'] = min(max(settings['output_scale'], 0.05), 1.0)
+    settings['min_jpeg_quality'] = min(max(settings['min_jpeg_quality'], 1), settings['jpeg_quality'])
+    settings['min_output_scale'] = min(max(settings['min_output_scale'], 0.05), settings['output_scale'])
+    return settings
+
+
+def detect_pose(frame, pose, rgb=None, small=None):
+    """Landmarks de pose de un frame BGR, o None.
+
+    Si rgb (preasignado) es más pequeño que el frame, se reduce antes a small
+    para inferir a menor resolución; los landmarks son normalizados (0-1), así
+    que se dibujan igual sobre el frame completo.
+    """
+    if rgb is not None and rgb.shape != frame.shape:
+        frame = cv2.resize(frame, (rgb.shape[1], rgb.shape[0]), dst=small,
+                           interpolation=cv2.INTER_AREA)
     # Convertir la imagen de BGR a RGB para MediaPipe
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    result = pose.process(rgb_frame)
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+    return pose.process(rgb_frame).pose_landmarks
+
+
+def process_frame(frame, pose, rgb=None, small=None, landmarks=None):
+    """Procesa cada frame usando MediaPipe para la estimación de pose.
+
+    El espejo se hace en el mismo buffer y, si se pasa rgb (preasignado), la
+    conversión de color se escribe ahí en lugar de crear un array nuevo. Con
+    pose=None no se infiere y se dibujan los landmarks recibidos (los del
+    último frame inferido). Devuelve (frame, landmarks).
+    """
+    frame = cv2.flip(frame, 1, dst=frame)
+    if pose is not None:
+        landmarks = detect_pose(frame, pose, rgb, small)
 
     # Dibujar la pose detectada en la imagen original (BGR)
-    if result.pose_landmarks:
-        mp_drawing.draw_landmarks(frame, result.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-    
-    return frame
+    if landmarks:
+        mp_drawing.draw_landmarks(frame, landmarks, mp_pose.POSE_CONNECTIONS)
+
+    return frame, landmarks
+
+
+class FrameRing:
+    """Anillo de buffers de frame preasignados en un bloque de memoria compartida.
+
+    La captura escribe directamente en un hueco (cap.read(image=...)) y otros
+    procesos pueden leerlo abriendo el bloque por nombre, sin copias.
+    """
+
+    def __init__(self, shape, count=3):
+        self.shape = tuple(shape)
+        self.count = count
+        self.slot_bytes = int(np.prod(self.shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * count)
+        self._slots = np.ndarray((count,) + self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._base = self._slots.__array_interface__['data'][0]
+        self._next = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getitem__(self, index):
+        return self._slots[index]
+
+    def advance(self):
+        """Índice del siguiente hueco a escribir (el más antiguo)"""
+        index = self._next
+        self._next = (self._next + 1) % self.count
+        return index
+
+    def locate(self, array):
+        """Offset en bytes dentro del bloque si array es uno de los huecos, o None"""
+        if array.shape != self.shape or array.dtype != np.uint8:
+            return None
+        offset = array.__array_interface__['data'][0] - self._base
+        if 0 <= offset < self.slot_bytes * self.count and offset % self.slot_bytes == 0:
+            return offset
+        return None
+
+    def close(self):
+        self._slots = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Aún hay vistas vivas; se libera al recogerlas
+        self._shm.unlink()
+
+
+_turbojpeg = None
+
+
+def _get_turbojpeg():
+    """Instancia compartida de TurboJPEG, o None si PyTurboJPEG/libjpeg-turbo no están"""
+    global _turbojpeg
+    if _turbojpeg is None:
+        try:
+            from turbojpeg import TurboJPEG
+            _turbojpeg = TurboJPEG()
+        except Exception as e:  # ImportError o librería nativa ausente
+            logger.info(f"libjpeg-turbo no disponible, se usa OpenCV: {str(e)}")
+            _turbojpeg = False
+    return _turbojpeg or None
+
+
+class JpegEncoder:
+    """Codificación JPEG de un feed con calidad y escala configurables.
+
+    En modo adaptativo se observa cada ventana de frames el tiempo medio de
+    codificación y la proporción de frames que los clientes no llegaron a
+    leer: si alguno supera su límite se baja la calidad (y, ya en el mínimo,
+    el tamaño); con margen de sobra se recuperan poco a poco.
+    """
+
+    WINDOW = 30
+    QUALITY_STEP = 10
+    SCALE_STEP = 0.1
+    MAX_DROP_RATIO = 0.5
+
+    def __init__(self, quality=80, scale=1.0, encoder='auto', adaptive=False,
+                 budget_ms=15.0, min_quality=40, min_scale=0.5):
+        self.base_quality = self.quality = quality
+        self.base_scale = self.scale = scale
+        self.adaptive = adaptive
+        self.budget_ms = budget_ms
+        self.min_quality = min_quality
+        self.min_scale = min_scale
+        self._turbo = _get_turbojpeg() if encoder in ('auto', 'turbojpeg') else None
+        if encoder == 'turbojpeg' and self._turbo is None:
+            logger.warning("VIDEO_JPEG_ENCODER=turbojpeg pero no está disponible; se usa OpenCV")
+        self.backend = 'turbojpeg' if self._turbo is not None else 'opencv'
+        self._resized = None
+        self._window = [0, 0.0, 0, 0]  # frames, ms, ofrecidos, descartados
+        self.encode_ms = 0.0
+
+    def encode(self, frame):
+        """Bytes JPEG del frame BGR, o None si falla la codificación"""
+        started = time.perf_counter()
+        if self.scale < 1.0:
+            height, width = frame.shape[:2]
+            size = (max(int(width * self.scale), 1), max(int(height * self.scale), 1))
+            if self._resized is None or self._resized.shape[1::-1] != size:
+                self._resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            frame = cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+
+        if self._turbo is not None:
+            jpeg = self._turbo.encode(frame, quality=self.quality)
+        else:
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            jpeg = buffer.tobytes() if ret else None
+        self._window[1] += (time.perf_counter() - started) * 1000
+        return jpeg
+
+    def observe(self, offered, dropped):
+        """Resultado de publicar un frame: clientes a los que se ofreció y cuántos no leyeron el anterior"""
+        window = self._window
+        window[0] += 1
+        window[2] += offered
+        window[3] += dropped
+        if window[0] < self.WINDOW:
+            return
+        self.encode_ms = window[1] / window[0]
+        drop_ratio = window[3] / window[2] if window[2] else 0.0
+        self._window = [0, 0.0, 0, 0]
+        if self.adaptive:
+            self._adapt(drop_ratio)
+
+    def _adapt(self, drop_ratio):
+        if self.encode_ms > self.budget_ms or drop_ratio > self.MAX_DROP_RATIO:
+            if self.quality > self.min_quality:
+                self.quality = max(self.quality - self.QUALITY_STEP, self.min_quality)
+            elif self.scale > self.min_scale:
+                self.scale = max(round(self.scale - self.SCALE_STEP, 2), self.min_scale)
+        elif self.encode_ms < self.budget_ms / 2 and drop_ratio == 0:
+            # Recuperar primero el tamaño y luego la calidad, de a poco
+            if self.scale < self.base_scale:
+                self.scale = min(round(self.scale + self.SCALE_STEP / 2, 2), self.base_scale)
+            elif self.quality < self.base_quality:
+                self.quality = min(self.quality + self.QUALITY_STEP // 2, self.base_quality)
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'quality': self.quality,
+            'scale': self.scale,
+            'adaptive': self.adaptive,
+            'encode_ms': round(self.encode_ms, 2),
+        }
+
+
+# Mismo atributo que el resultado de mp_pose.Pose.process, para process_frame
+PoseResult = namedtuple('PoseResult', 'pose_landmarks')
+
+
+def landmarks_array(landmark_list):
+    """NormalizedLandmarkList -> (33, 4) float32 [x, y, z, visibility]"""
+    return np.array([[lm.x, lm.y, lm.z, lm.visibility] for lm in landmark_list.landmark],
+                    dtype=np.float32)
+
+
+def _to_landmark_list(landmarks):
+    """(33, 4) float32 [x, y, z, visibility] -> NormalizedLandmarkList para dibujar"""
+    from mediapipe.framework.formats import landmark_pb2
+    return landmark_pb2.NormalizedLandmarkList(landmark=[
+        landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=visibility)
+        for x, y, z, visibility in landmarks.tolist()
+    ])
+
+
+def _pose_worker(conn, pose_options):
+    """Proceso de inferencia: lee el frame de la memoria compartida y
+    devuelve solo los landmarks (unos cientos de bytes)"""
+    pose = mp_pose.Pose(**pose_options)
+    attached = {}
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+
+            name, shape, offset = message
+            if name not in attached:
+                if len(attached) >= 4:
+                    # Bloques de anillos ya descartados por el proceso principal
+                    for old in attached.values():
+                        old.close()
+                    attached = {}
+                attached[name] = shared_memory.SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=attached[name].buf, offset=offset)
+            result = pose.process(frame)
+            del frame  # Liberar la vista antes de un posible close()
+
+            if result.pose_landmarks:
+                conn.send_bytes(landmarks_array(result.pose_landmarks).tobytes())
+            else:
+                conn.send_bytes(b'')
+    finally:
+        pose.close()
+        for shm in attached.values():
+            shm.close()
+
 
-def gen_video_feed(camera_id):
+_process_context = None
+
+
+def _get_process_context():
+    """Contexto para los procesos de pose: nunca fork desde el servidor, que
+    ya tiene hilos (cámaras, puerto serie, gunicorn) y el hijo podría heredar
+    un lock tomado. Con forkserver el servidor de procesos importa este módulo
+    (cv2 + mediapipe) una vez y cada worker sale de ahí ya cargado."""
+    global _process_context
+    if _process_context is None:
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        _process_context = context
+    return _process_context
+
+
+class PoseProcess:
+    """Backend de inferencia en un proceso dedicado con su propia instancia de Pose.
+
+    Expone el mismo process()/close() que mp_pose.Pose. Si el frame ya es un
+    hueco del FrameRing asignado con use_ring() no se copia nada; si no, se
+    copia a un bloque de memoria compartida propio (nunca se serializa). Por
+    el pipe solo viajan nombre del bloque, forma y offset, y los landmarks
+    de vuelta.
+    """
+
+    def __init__(self, pose_options=None, name='pose-worker'):
+        context = _get_process_context()
+        self._conn, child_conn = context.Pipe()
+        self._shm = None
+        self._ring = None
+        # El hijo debe heredar el mismo resource_tracker; si arrancara el suyo
+        # daría por "filtrados" los bloques que crea y borra este proceso
+        resource_tracker.ensure_running()
+        self._process = context.Process(target=_pose_worker,
+                                        args=(child_conn, pose_options or {}),
+                                        name=name,
+                                        daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def use_ring(self, ring):
+        self._ring = ring
+
+    def process(self, rgb_frame):
+        offset = self._ring.locate(rgb_frame) if self._ring is not None else None
+        if offset is not None:
+            self._conn.send((self._ring.name, rgb_frame.shape, offset))
+        else:
+            if self._shm is None or self._shm.size < rgb_frame.nbytes:
+                self._release_shm()
+                self._shm = shared_memory.SharedMemory(create=True, size=rgb_frame.nbytes)
+            buffer = np.ndarray(rgb_frame.shape, dtype=np.uint8, buffer=self._shm.buf)
+            np.copyto(buffer, rgb_frame)
+            del buffer
+            self._conn.send((self._shm.name, rgb_frame.shape, 0))
+
+        data = self._conn.recv_bytes()
+        if not data:
+            return PoseResult(None)
+        return PoseResult(_to_landmark_list(np.frombuffer(data, dtype=np.float32).reshape(-1, 4)))
+
+    def _release_shm(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        self._release_shm()
+
+
+def create_pose(backend='inline', name='pose-worker', pose_options=None):
+    """Pose en el propio hilo ('inline') o en un proceso aparte ('process')"""
+    if backend == 'process':
+        return PoseProcess(pose_options, name=name)
+    return mp_pose.Pose(**(pose_options or {}))
+
+
+class Subscriber:
+    """Buzón de una sola plaza para un cliente: el frame nuevo pisa al no leído.
+
+    Un cliente lento nunca frena la captura; solo se salta frames, que quedan
+    contados en dropped.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+        self.connected_at = time.time()
+        self.delivered = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._slot = None
+        self._closed = False
+
+    def offer(self, data):
+        """Lo llama el productor; nunca bloquea. True si pisó un mensaje sin leer"""
+        with self._lock:
+            dropped = self._slot is not None
+            if dropped:
+                self.dropped += 1
+            self._slot = data
+            self._ready.set()
+            return dropped
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._ready.set()
+
+    def take(self):
+        """Espera el siguiente frame/mensaje; None cuando el productor terminó"""
+        while True:
+            self._ready.wait()
+            with self._lock:
+                data, self._slot = self._slot, None
+                self._ready.clear()
+                if data is not None:
+                    self.delivered += 1
+                    self.bytes_sent += len(data)
+                    return data
+                if self._closed:
+                    return None
+
+    def stats(self):
+        elapsed = max(time.time() - self.connected_at, 1e-6)
+        return {
+            'client': self.client,
+            'connected_since': self.connected_at,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'fps': round(self.delivered / elapsed, 1),
+            'kbytes_s': round(self.bytes_sent / elapsed / 1024, 1),
+        }
+
+
+class CameraStream:
+    """Productor único por cámara: captura, pose y JPEG una sola vez por frame.
+
+    Cualquier número de clientes se suscribe y recibe el JPEG más reciente,
+    y aparte los de landmarks reciben el resultado de cada inferencia en
+    JSON; la cámara se libera cuando no queda nadie de ninguno de los dos
+    tipos durante idle_timeout segundos.
+    """
+
+    def __init__(self, camera_id, idle_timeout=5.0, backend='inline', ring_size=3, settings=None):
+        self.camera_id = camera_id
+        self.idle_timeout = idle_timeout
+        self.backend = backend
+        self.ring_size = ring_size
+        self.settings = settings or camera_settings(camera_id)
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._landmark_subscribers = set()
+        self._latest = None
+        self._running = False
+        self._thread = None
+        self.frames_produced = 0
+        self.frames_inferred = 0
+        self.encoder = None
+        self._started_at = None
+
+    def frames(self, client=None):
+        """Generador de JPEGs para un cliente; nunca procesa nada por su cuenta"""
+        yield from self._consume(client, self._subscribers)
+
+    def landmarks(self, client=None):
+        """Generador de mensajes JSON (bytes) con los landmarks de cada frame inferido"""
+        yield from self._consume(client, self._landmark_subscribers)
+
+    def subscribe_landmarks(self, client=None):
+        """Suscripción directa para consumidores dentro del proceso (p.ej. la
+        teleoperación): take() sobre el Subscriber devuelto y unsubscribe() al acabar"""
+        return self._subscribe(client, self._landmark_subscribers)
+
+    def unsubscribe(self, subscriber):
+        self._unsubscribe(subscriber)
+
+    def _consume(self, client, subscribers):
+        subscriber = self._subscribe(client, subscribers)
+        try:
+            while True:
+                data = subscriber.take()
+                if data is None:
+                    return  # El productor terminó (cámara cerrada o sin frames)
+                yield data
+        finally:
+            self._unsubscribe(subscriber)
+
+    def _subscribe(self, client, subscribers):
+        subscriber = Subscriber(client)
+        with self._lock:
+            subscribers.add(subscriber)
+            if subscribers is self._subscribers and self._running and self._latest is not None:
+                subscriber.offer(self._latest)  # Primer frame sin esperar al siguiente
+            if not self._running:
+                self._running = True
+                self._latest = None
+                # El hilo anterior puede estar aún soltando la cámara
+                self._thread = threading.Thread(target=self._run,
+                                                args=(self._thread,),
+                                                name=f'camera-{self.camera_id}',
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self._landmark_subscribers.discard(subscriber)
+
+    def _publish(self, jpeg):
+        with self._lock:
+            self._latest = jpeg
+            self.frames_produced += 1
+            subscribers = list(self._subscribers)
+        dropped = 0
+        for subscriber in subscribers:
+            dropped += subscriber.offer(jpeg)
+        return len(subscribers), dropped
+
+    def _publish_landmarks(self, landmarks, frame_number, captured_at, frame_shape):
+        """Un único JSON compacto por inferencia, compartido por todos los clientes
+
+        Los landmarks vienen normalizados a 0-1 en cada eje; 'size' ([ancho, alto])
+        permite a quien los consuma recuperar la relación de aspecto.
+        """
+        values = None
+        if landmarks:
+            # 33 puntos x [x, y, z, visibility] en una lista plana, 4 decimales
+            values = np.round(landmarks_array(landmarks).astype(np.float64), 4).ravel().tolist()
+        message = json.dumps({
+            'camera': self.camera_id,
+            'frame': frame_number,
+            't': round(captured_at, 3),
+            'size': [int(frame_shape[1]), int(frame_shape[0])],
+            'landmarks': values,
+        }, separators=(',', ':')).encode()
+        with self._lock:
+            subscribers = list(self._landmark_subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(message)
+
+    def _should_stop(self, idle_since):
+        with self._lock:
+            if self._subscribers or self._landmark_subscribers:
+                return False, None
+            if idle_since is None:
+                return False, time.monotonic()
+            if time.monotonic() - idle_since > self.idle_timeout:
+                # Marcarlo aquí, con el lock, para que un nuevo cliente arranque otro hilo
+                self._running = False
+                return True, idle_since
+            return False, idle_since
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            landmark_subscribers = list(self._landmark_subscribers)
+            running = self._running
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            'camera_id': self.camera_id,
+            'running': running,
+            'backend': self.backend,
+            'settings': {key: value for key, value in self.settings.items() if key != 'backend'},
+            'frames_produced': self.frames_produced,
+            'frames_inferred': self.frames_inferred,
+            'fps': round(self.frames_produced / elapsed, 1) if elapsed else 0.0,
+            'inference_fps': round(self.frames_inferred / elapsed, 1) if elapsed else 0.0,
+            'encoder': self.encoder.stats() if self.encoder is not None else None,
+            'clients': [subscriber.stats() for subscriber in subscribers],
+            'landmark_clients': [subscriber.stats() for subscriber in landmark_subscribers],
+        }
+
+    def _run(self, previous=None):
+        if previous is not None:
+            previous.join()
+        cap = cv2.VideoCapture(self.camera_id)
+        # Sin cola en el driver: siempre se procesa el frame más reciente
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Una sola instancia de MediaPipe Pose por cámara, compartida por todos
+        # los clientes; con backend 'process' corre en su propio proceso/núcleo
+        settings = self.settings
+        pose = create_pose(self.backend, name=f'pose-camera-{self.camera_id}',
+                           pose_options={key: settings[key] for key in POSE_OPTIONS})
+        # Anillos BGR (captura/dibujo/JPEG) y RGB (inferencia, a la escala
+        # configurada) en memoria compartida; se crean con el primer frame
+        bgr_ring = rgb_ring = small = None
+        encoder = self.encoder = JpegEncoder(quality=settings['jpeg_quality'],
+                                             scale=settings['output_scale'],
+                                             encoder=settings['encoder'],
+                                             adaptive=settings['adaptive'],
+                                             budget_ms=settings['encode_budget_ms'],
+                                             min_quality=settings['min_jpeg_quality'],
+                                             min_scale=settings['min_output_scale'])
+        landmarks = None
+        idle_since = None
+        self.frames_produced = 0
+        self.frames_inferred = 0
+        self._started_at = time.monotonic()
+        try:
+            while cap.isOpened():
+                stop, idle_since = self._should_stop(idle_since)
+                if stop:
+                    break
+
+                index = bgr_ring.advance() if bgr_ring is not None else 0
+                ret, frame = cap.read(image=bgr_ring[index] if bgr_ring is not None else None)
+                if not ret:
+                    break
+                captured_at = time.time()
+
+                if bgr_ring is None or bgr_ring.locate(frame) is None:
+                    # Primer frame o cambio de resolución: (re)crear los anillos
+                    for ring in (bgr_ring, rgb_ring):
+                        if ring is not None:
+                            ring.close()
+                    height, width = frame.shape[:2]
+                    inference_shape = (max(int(round(height * settings['scale'])), 1),
+                                       max(int(round(width * settings['scale'])), 1), 3)
+                    bgr_ring = FrameRing(frame.shape, self.ring_size)
+                    rgb_ring = FrameRing(inference_shape, self.ring_size)
+                    small = np.empty(inference_shape, dtype=np.uint8) if inference_shape != frame.shape else None
+                    if hasattr(pose, 'use_ring'):
+                        pose.use_ring(rgb_ring)
+                    index = bgr_ring.advance()
+                    np.copyto(bgr_ring[index], frame)
+                    frame = bgr_ring[index]
+
+                # Solo se infiere cada 'stride' frames; en medio se reutilizan los landmarks
+                infer = self.frames_produced % settings['stride'] == 0
+                frame, landmarks = process_frame(frame, pose if infer else None,
+                                                 rgb=rgb_ring[index], small=small, landmarks=landmarks)
+                if infer:
+                    self.frames_inferred += 1
+                    if self._landmark_subscribers:
+                        self._publish_landmarks(landmarks, self.frames_produced, captured_at, frame.shape)
+
+                # Codificar la imagen a JPEG una sola vez para todos
+                jpeg = encoder.encode(frame)
+                if jpeg is None:
+                    continue
+                encoder.observe(*self._publish(jpeg))
+        except Exception as e:
+            logger.error(f"Error en la cámara {self.camera_id}: {str(e)}")
+        finally:
+            cap.release()
+            pose.close()
+            frame = small = None
+            for ring in (bgr_ring, rgb_ring):
+                if ring is not None:
+                    ring.close()
+            subscribers = []
+            with self._lock:
+                # Si ya arrancó otro hilo, los clientes actuales son suyos:
+                # los que se suscribieron durante este cierre esperan sus frames
+                if self._thread is threading.current_thread():
+                    self._running = False
+                    subscribers = list(self._subscribers) + list(self._landmark_subscribers)
+            for subscriber in subscribers:
+                subscriber.close()
+            logger.info(f"Cámara {self.camera_id} liberada")
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def get_camera_stream(camera_id):
+    """Devuelve el productor compartido de la cámara (uno por proceso)"""
+    with _streams_lock:
+        stream = _streams.get(camera_id)
+        if stream is None:
+            stream = _streams[camera_id] = CameraStream(camera_id, backend=_settings['backend'],
+                                                          settings=camera_settings(camera_id))
+        return stream
+
+
+def get_stream_stats():
+    """Frames producidos por cámara y entregados/descartados por cliente"""
+    with _streams_lock:
+        streams = list(_streams.values())
+    return [stream.stats() for stream in streams]
+
+
+def gen_video_feed(camera_id, client=None):
     """Genera el video capturado y procesado por MediaPipe para la cámara especificada."""
-    cap = cv2.VideoCapture(camera_id)
-
-    # Crear una nueva instancia de MediaPipe Pose para esta cámara
-    pose = mp_pose.Pose()
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Procesar cada frame con la instancia de pose de esta cámara
-        frame = process_frame(frame, pose)
-        
-        # Codificar la imagen a JPEG
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        
+    for frame in get_camera_stream(camera_id).frames(client):
         # Devolver el frame
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
+
+def gen_landmark_feed(camera_id, client=None, fmt='sse'):
+    """Landmarks de la cámara como Server-Sent Events ('sse') o JSON por líneas ('ndjson').
+
+    Cada mensaje: {"camera", "frame", "t" (epoch de captura), "size" ([ancho, alto]),
+    "landmarks"} con landmarks como lista plana de 33*4 floats [x, y, z, visibility]
+    normalizados a 0-1, o null si no se detectó a nadie.
+    """
+    for message in get_camera_stream(camera_id).landmarks(client):
+        if fmt == 'ndjson':
+            yield message + b'\n'
+        else:
+            yield b'data: ' + message + b'\n\n'